@@ -3,6 +3,7 @@
 Handles connection, request/response waiting and asynchronous server events.
 """
 
+import base64
 import json
 import socket
 import threading
@@ -10,7 +11,7 @@ from dataclasses import dataclass
 from queue import Queue, Empty
 from typing import Any, Dict, Iterable, List, Optional, Set
 
-from server.protocol import send_json, recv_json
+from server.protocol import open_reader, send_json, recv_json
 
 
 class ApiClientError(Exception):
@@ -34,6 +35,8 @@ class ApiClient:
         self._sock: Optional[socket.socket] = None
         self._receiver: Optional[threading.Thread] = None
         self._send_lock = threading.Lock()
+        # Held from send until the response arrives, so callers on any thread take turns
+        self._request_lock = threading.Lock()
         self._wait_lock = threading.Lock()
         self._wait_types: Set[str] = set()
         self._wait_response: Optional[Dict[str, Any]] = None
@@ -51,6 +54,8 @@ class ApiClient:
             return
         sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
         sock.settimeout(None)
+        # Requests are written whole; don't let Nagle hold one back behind an unacknowledged one
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
         self._sock = sock
         self._connected = True
         self._receiver = threading.Thread(target=self._recv_loop, daemon=True)
@@ -144,10 +149,10 @@ class ApiClient:
         }, expected={"UPDATE_RATING_OK", "UPDATE_RATING_FAIL"})
 
     def start_ride(self, ride_id: int) -> Dict[str, Any]:
-        return self._send_and_wait("START_RIDE", {"ride_id": ride_id}, expected={"START_RIDE_OK"})
+        return self._send_and_wait("START_RIDE", {"ride_id": ride_id}, expected={"START_RIDE_OK", "START_RIDE_FAIL"})
 
     def complete_ride(self, ride_id: int) -> Dict[str, Any]:
-        return self._send_and_wait("COMPLETE_RIDE", {"ride_id": ride_id}, expected={"COMPLETE_RIDE_OK"})
+        return self._send_and_wait("COMPLETE_RIDE", {"ride_id": ride_id}, expected={"COMPLETE_RIDE_OK", "COMPLETE_RIDE_FAIL"})
 
     def cancel_ride(self, ride_id: int) -> Dict[str, Any]:
         return self._send_and_wait("CANCEL_RIDE", {"ride_id": ride_id}, expected={"CANCEL_RIDE_OK", "CANCEL_RIDE_FAIL"})
@@ -158,15 +163,17 @@ class ApiClient:
     def fetch_messages(self, user_id: int, partner_id: int) -> Dict[str, Any]:
         return self._send_and_wait("FETCH_MESSAGES", {"user_id": user_id, "partner_id": partner_id}, expected={"MESSAGES"})
 
-    def send_message(self, to_username: str, message: str, attachment_filename: str = None, attachment_mime: str = None, attachment_data: str = None) -> Dict[str, Any]:
+    def send_message(self, to_username: str, message: str, attachment_filename: str = None, attachment_mime: str = None, attachment_data: str = None, attachment_bytes: bytes = None) -> Dict[str, Any]:
+        """Send a chat message; pass the attachment as raw `attachment_bytes` (sent out of band) or base64 `attachment_data`."""
         payload = {"to": to_username, "message": message}
         if attachment_filename is not None:
             payload["attachment_filename"] = attachment_filename
         if attachment_mime is not None:
             payload["attachment_mime"] = attachment_mime
-        if attachment_data is not None:
+        if attachment_data is not None and attachment_bytes is None:
             payload["attachment_data"] = attachment_data
-        return self._send_and_wait("SEND_MESSAGE", payload, expected={"SEND_MESSAGE_OK", "SEND_MESSAGE_FAIL"})
+        return self._send_and_wait("SEND_MESSAGE", payload, expected={"SEND_MESSAGE_OK", "SEND_MESSAGE_FAIL"},
+                                   attachment=attachment_bytes)
 
     def drain_events(self) -> List[ApiEvent]:
         events: List[ApiEvent] = []
@@ -186,9 +193,17 @@ class ApiClient:
             raise ApiClientError("Not connected to backend.")
         return self._sock
 
-    def _send_and_wait(self, msg_type: str, payload: Dict[str, Any], expected: Iterable[str]) -> Dict[str, Any]:
+    def _send_and_wait(self, msg_type: str, payload: Dict[str, Any], expected: Iterable[str], attachment: Optional[bytes] = None) -> Dict[str, Any]:
         sock = self._ensure_connection()
         expected_types = set(expected)
+        if not self._request_lock.acquire(timeout=self.timeout):
+            raise ApiClientError("Another request is already in-flight.")
+        try:
+            return self._send_and_wait_locked(sock, msg_type, payload, expected_types, attachment)
+        finally:
+            self._request_lock.release()
+
+    def _send_and_wait_locked(self, sock: socket.socket, msg_type: str, payload: Dict[str, Any], expected_types: Set[str], attachment: Optional[bytes]) -> Dict[str, Any]:
         with self._send_lock:
             with self._wait_lock:
                 if self._wait_types:
@@ -196,7 +211,7 @@ class ApiClient:
                 self._wait_types = expected_types
                 self._wait_response = None
                 self._wait_event.clear()
-            send_json(sock, {"type": msg_type, "payload": payload})
+            send_json(sock, {"type": msg_type, "payload": payload}, attachment=attachment)
         if not self._wait_event.wait(self.timeout):
             with self._wait_lock:
                 self._wait_types = set()
@@ -213,7 +228,8 @@ class ApiClient:
         try:
             with socket.create_connection((self.host, self.port), timeout=self.timeout) as conn:
                 send_json(conn, message)
-                response = recv_json(conn)
+                with open_reader(conn) as reader:
+                    response = recv_json(reader)
         except (ConnectionRefusedError, socket.timeout, OSError) as exc:
             raise ApiClientError(f"Unable to reach server: {exc}") from exc
         if response is None:
@@ -222,21 +238,27 @@ class ApiClient:
 
     def _recv_loop(self) -> None:
         sock = self._ensure_connection()
-        while self._connected:
-            try:
-                data = recv_json(sock)
-            except (ConnectionResetError, OSError):
-                data = None
-            if not data:
-                self._connected = False
-                self._async_events.put({"type": "CONNECTION_LOST", "payload": {}})
-                break
-            handled = False
-            with self._wait_lock:
-                if self._wait_types and data.get("type") in self._wait_types:
-                    self._wait_response = data
-                    self._wait_types = set()
-                    self._wait_event.set()
-                    handled = True
-            if not handled:
-                self._async_events.put(data)
+        # disconnect() shuts the socket down, which ends a blocked read here
+        with open_reader(sock) as reader:
+            while self._connected:
+                try:
+                    data = recv_json(reader)
+                except (ConnectionResetError, OSError):
+                    data = None
+                if not data:
+                    self._connected = False
+                    self._async_events.put({"type": "CONNECTION_LOST", "payload": {}})
+                    break
+                payload = data.get("payload")
+                if isinstance(payload, dict) and "attachment_bytes" in payload:
+                    # The UI renders attachments from base64 (e.g. image data URIs)
+                    payload["attachment_data"] = base64.b64encode(payload.pop("attachment_bytes")).decode("ascii")
+                handled = False
+                with self._wait_lock:
+                    if self._wait_types and data.get("type") in self._wait_types:
+                        self._wait_response = data
+                        self._wait_types = set()
+                        self._wait_event.set()
+                        handled = True
+                if not handled:
+                    self._async_events.put(data)
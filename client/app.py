@@ -11,9 +11,12 @@ from .preliminary_page import PreliminaryPage
 from .main_page import MainPage
 from .api_client import ApiClient
 from .peer import PeerServer
+from .ui_styles import GLOBAL_QSS
 
 def build_app():
     app = QApplication(sys.argv)
+    # One application-wide stylesheet instead of a parse per page
+    app.setStyleSheet(GLOBAL_QSS)
 
     # Shared application state (in-memory). Holds authenticated user info and API client.
     app_state = {"api": ApiClient()}
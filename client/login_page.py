@@ -6,10 +6,12 @@
 from PyQt5.QtWidgets import QWidget, QVBoxLayout, QLabel, QLineEdit, QPushButton, QMessageBox, QHBoxLayout # type: ignore
 from PyQt5.QtGui import QFont # type: ignore
 from PyQt5.QtCore import Qt # type: ignore
-from .logo_widget import get_logo_label, AUBUS_MAROON
+from .logo_widget import get_logo_label
 from .ui_styles import style_button, set_title_label, style_input
 from .validators import is_valid_email
 from .api_client import ApiClientError
+from .navigation import page_index
+from .roles import set_role
 
 class LoginPage(QWidget):
     def __init__(self, parent_stack=None, app_state=None):
@@ -18,6 +20,7 @@ class LoginPage(QWidget):
         app_state: dictionary for shared state across pages (e.g., user info)
         """
         super().__init__()
+        self.setObjectName("LoginPage")
         self.parent_stack = parent_stack
         self.app_state = app_state or {}
         self.init_ui()
@@ -81,19 +84,6 @@ class LoginPage(QWidget):
         outer.addLayout(h_layout)
         outer.addStretch()
 
-        # minor styling
-        self.setStyleSheet(f"""
-            QWidget {{
-                font-family: Verdana;
-            }}
-            QPushButton {{
-                background-color: white;
-                border-radius: 6px;
-                padding: 8px;
-            }}
-            QLabel{{ color: {AUBUS_MAROON}; }}
-        """)
-
         self.setLayout(outer)
 
     def on_login_clicked(self):
@@ -131,7 +121,7 @@ class LoginPage(QWidget):
         self.app_state['area'] = user.get("area")
         self.app_state['username'] = user.get("username")
         self.app_state['role_selected'] = user.get("role_selected", False)
-        self.app_state['role'] = "driver" if user.get("is_driver") else "passenger"
+        set_role(self.app_state, "driver" if user.get("is_driver") else "passenger")
 
         # Announce our peer listening port (if peer server was started)
         api = self.app_state.get('api')
@@ -147,19 +137,19 @@ class LoginPage(QWidget):
                 pass
         if self.parent_stack:
             if self.app_state['role_selected']:
-                main_page = self.parent_stack.findChild(QWidget, "MainPage")
-                if main_page:
-                    self.parent_stack.setCurrentIndex(self.parent_stack.indexOf(main_page))
+                index = page_index(self.parent_stack, "MainPage")
+                if index >= 0:
+                    self.parent_stack.setCurrentIndex(index)
                 else:
                     QMessageBox.warning(self, "Navigation error", "Main page not found.")
             else:
-                preliminary = self.parent_stack.findChild(QWidget, "PreliminaryPage")
-                if preliminary:
-                    self.parent_stack.setCurrentIndex(self.parent_stack.indexOf(preliminary))
+                index = page_index(self.parent_stack, "PreliminaryPage")
+                if index >= 0:
+                    self.parent_stack.setCurrentIndex(index)
 
     def go_to_register(self):
         if self.parent_stack:
-            self.parent_stack.setCurrentIndex(self.parent_stack.indexOf(self.parent_stack.findChild(QWidget, "RegisterPage")))
+            self.parent_stack.setCurrentIndex(page_index(self.parent_stack, "RegisterPage"))
 
     def reset_form(self):
         """Clear email and password inputs."""
@@ -16,6 +16,7 @@ from .progress_page import ProgressPage
 from PyQt5.QtWidgets import QPushButton # type: ignore
 from .ui_styles import style_button
 from .settings_tab import SettingsTab
+from .navigation import find_page, page_index
 
 class MainPage(QWidget):
     def __init__(self, parent_stack=None, app_state=None):
@@ -138,16 +139,16 @@ class MainPage(QWidget):
             if api:
                 self.app_state["api"] = api
             # Reset form pages
-            login_page = self.parent_stack.findChild(QWidget, "LoginPage")
-            register_page = self.parent_stack.findChild(QWidget, "RegisterPage")
-            preliminary_page = self.parent_stack.findChild(QWidget, "PreliminaryPage")
+            login_page = find_page(self.parent_stack, "LoginPage")
+            register_page = find_page(self.parent_stack, "RegisterPage")
+            preliminary_page = find_page(self.parent_stack, "PreliminaryPage")
             if login_page and hasattr(login_page, 'reset_form'):
                 login_page.reset_form()
             if register_page and hasattr(register_page, 'reset_form'):
                 register_page.reset_form()
             if preliminary_page and hasattr(preliminary_page, 'reset_role'):
                 preliminary_page.reset_role()
-            self.parent_stack.setCurrentIndex(self.parent_stack.indexOf(login_page))
+            self.parent_stack.setCurrentIndex(page_index(self.parent_stack, "LoginPage"))
 
     def on_tab_changed(self, index):
         widget = self.tabs.widget(index)
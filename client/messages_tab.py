@@ -193,6 +193,7 @@ class MessagesTab(QWidget):
         attachment_filename = getattr(self, '_attachment_filename', None)
         attachment_mime = getattr(self, '_attachment_mime', None)
         attachment_data = getattr(self, '_attachment_data', None)
+        attachment_bytes = getattr(self, '_attachment_bytes', None)
 
         if peer_ip and peer_port:
             try:
@@ -211,6 +212,8 @@ class MessagesTab(QWidget):
                 # clear attachment after sending
                 if hasattr(self, '_attachment_data'):
                     delattr(self, '_attachment_data')
+                if hasattr(self, '_attachment_bytes'):
+                    delattr(self, '_attachment_bytes')
                 if hasattr(self, '_attachment_filename'):
                     delattr(self, '_attachment_filename')
                 if hasattr(self, '_attachment_mime'):
@@ -231,6 +234,7 @@ class MessagesTab(QWidget):
                 attachment_filename=attachment_filename,
                 attachment_mime=attachment_mime,
                 attachment_data=attachment_data,
+                attachment_bytes=attachment_bytes,
             )
         except ApiClientError as exc:
             QMessageBox.critical(self, "Unable to send", str(exc))
@@ -250,6 +254,8 @@ class MessagesTab(QWidget):
             # clear attachment after sending
             if hasattr(self, '_attachment_data'):
                 delattr(self, '_attachment_data')
+            if hasattr(self, '_attachment_bytes'):
+                delattr(self, '_attachment_bytes')
             if hasattr(self, '_attachment_filename'):
                 delattr(self, '_attachment_filename')
             if hasattr(self, '_attachment_mime'):
@@ -306,6 +312,8 @@ class MessagesTab(QWidget):
                 mime = 'application/octet-stream'
             # store for next send
             self._attachment_data = b64
+            # Raw bytes for the server relay, which carries them out of band
+            self._attachment_bytes = data
             self._attachment_filename = fname.split('/')[-1].split('\\')[-1]
             self._attachment_mime = mime
             self.attachment_label.setText(f"Attached: {self._attachment_filename}")
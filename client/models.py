@@ -0,0 +1,50 @@
+"""Shared item models for the fixed choice lists used across the client.
+
+Combo boxes showing the same list (areas, days, directions, schedule time slots) point at a
+single `QStringListModel` instead of each holding its own copy of the items.
+Models are created on first use because they need the QApplication to exist.
+"""
+
+from PyQt5.QtCore import QStringListModel # type: ignore
+
+AREA_PLACEHOLDER = "-- Select Area --"
+AREAS = (AREA_PLACEHOLDER, "Beirut", "Batroun", "Tripoli", "Saida", "Baalbek", "Zahle", "Nabatieh", "Metn")
+# area name -> row in AREAS, so pre-selecting an area needs no findText scan
+AREA_INDEX = {area: i for i, area in enumerate(AREAS)}
+
+DAYS = ("Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday")
+# Route labels; the server stores these as the schedule direction
+DIRECTIONS = ("To University", "From University")
+
+# Schedule time slots every 15 minutes, with "-" meaning no ride that day/route
+TIME_SLOTS = ("-",) + tuple(f"{hour:02d}:{minute:02d}" for hour in range(24) for minute in range(0, 60, 15))
+
+_models = {}
+
+
+def _shared_model(key, items):
+    model = _models.get(key)
+    if model is None:
+        model = QStringListModel(list(items))
+        _models[key] = model
+    return model
+
+
+def areas_model():
+    """Model backing every area combo box."""
+    return _shared_model("areas", AREAS)
+
+
+def days_model():
+    """Model backing every weekday combo box."""
+    return _shared_model("days", DAYS)
+
+
+def directions_model():
+    """Model backing every route direction combo box."""
+    return _shared_model("directions", DIRECTIONS)
+
+
+def time_slots_model():
+    """Model backing every schedule time-slot combo box."""
+    return _shared_model("time_slots", TIME_SLOTS)
@@ -0,0 +1,35 @@
+"""Cached page lookups on the shared QStackedWidget.
+
+Pages are registered once in `app.build_app`, so the `findChild` tree walk and
+`indexOf` scan only need to run the first time a page is looked up.
+"""
+
+import weakref
+
+from PyQt5.QtWidgets import QWidget # type: ignore
+
+# stack -> {objectName: (page widget, index)}
+_page_cache = weakref.WeakKeyDictionary()
+
+
+def _lookup(stack, name):
+    pages = _page_cache.setdefault(stack, {})
+    entry = pages.get(name)
+    if entry is None:
+        page = stack.findChild(QWidget, name)
+        index = stack.indexOf(page) if page else -1
+        entry = (page, index)
+        # Only cache hits so pages added to the stack later are still found
+        if index >= 0:
+            pages[name] = entry
+    return entry
+
+
+def find_page(stack, name):
+    """Return the page widget named `name` in `stack`, or None."""
+    return _lookup(stack, name)[0]
+
+
+def page_index(stack, name):
+    """Return the index of the page named `name` in `stack`, or -1."""
+    return _lookup(stack, name)[1]
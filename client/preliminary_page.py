@@ -4,9 +4,11 @@
 from PyQt5.QtWidgets import QWidget, QVBoxLayout, QLabel, QPushButton, QHBoxLayout # type: ignore
 from PyQt5.QtGui import QFont # type: ignore
 from PyQt5.QtCore import Qt # type: ignore
-from .logo_widget import get_logo_label, AUBUS_MAROON
+from .logo_widget import get_logo_label
 from .ui_styles import style_button, set_title_label
 from .api_client import ApiClientError
+from .navigation import page_index
+from .roles import clear_role, set_role
 from PyQt5.QtWidgets import QMessageBox  # type: ignore
 
 class PreliminaryPage(QWidget):
@@ -57,7 +59,6 @@ class PreliminaryPage(QWidget):
         outer.addLayout(h_layout)
         outer.addStretch()
 
-        self.setStyleSheet(f"QLabel{{ color: {AUBUS_MAROON}; }} QPushButton{{ padding:8px; border-radius:6px; }}")
         self.setLayout(outer)
 
     def choose_role(self, role):
@@ -71,14 +72,13 @@ class PreliminaryPage(QWidget):
         except ApiClientError as exc:
             QMessageBox.critical(self, "Unable to save", str(exc))
             return
-        self.app_state['role'] = role
+        set_role(self.app_state, role)
         self.app_state['role_selected'] = True
         if self.parent_stack:
-            main_page = self.parent_stack.findChild(QWidget, "MainPage")
-            if main_page:
-                self.parent_stack.setCurrentIndex(self.parent_stack.indexOf(main_page))
+            index = page_index(self.parent_stack, "MainPage")
+            if index >= 0:
+                self.parent_stack.setCurrentIndex(index)
 
     def reset_role(self):
         """Clear the role selection from app state."""
-        if 'role' in self.app_state:
-            del self.app_state['role']
+        clear_role(self.app_state)
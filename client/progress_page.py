@@ -2,10 +2,14 @@
 # Progress page: shows ride details and weather. Driver can start/end ride.
 # Weather widget is a placeholder; a real API integration should replace 'refresh_weather' behavior.
 
+import time
 from PyQt5.QtWidgets import QWidget, QVBoxLayout, QLabel, QPushButton, QHBoxLayout, QMessageBox # type: ignore
 from .logo_widget import get_logo_label
 from .ui_styles import set_title_label, style_button
-from .api_client import ApiClientError
+from .workers import run_in_background
+
+# Seconds a fetched passenger list stays valid when no ride state has changed
+PASSENGER_CACHE_TTL = 5.0
 
 class ProgressPage(QWidget):
     def __init__(self, app_state=None, on_ride_end=None):
@@ -15,6 +19,9 @@ class ProgressPage(QWidget):
         self.ride_info = {}
         self.on_ride_end = on_ride_end
         self.ride_started = False  # Track if ride has been started
+        # (user_id, ride_id) -> (passenger names, fetched at, rides_version)
+        self._passenger_cache = {}
+        self._in_flight = set()  # buttons whose request has not returned yet
         self.init_ui()
 
     def init_ui(self):
@@ -55,101 +62,165 @@ class ProgressPage(QWidget):
         self.ride_info = ride_info
         self.ride_started = False  # Reset ride started flag
         role = ride_info.get("role", "passenger")
-        self.start_btn.setVisible(role == "driver")
-        self.start_btn.setEnabled(role == "driver")
+        started = ride_info.get("status") == "STARTED"
+        partner_name = ride_info.get("partner_name")
+        accepted_by = ride_info.get("accepted_by")
+        is_driver = role == "driver"
+        self.start_btn.setVisible(is_driver)
+        self.start_btn.setEnabled(is_driver and self.start_btn not in self._in_flight)
         # End button is enabled when the ride is started
-        started = (ride_info.get("status") == "STARTED")
-        self.end_btn.setEnabled(started)
+        self.end_btn.setEnabled(started and self.end_btn not in self._in_flight)
         # Show leave option for passenger when ride not started
         if role == "passenger":
-            self.leave_btn.setVisible(ride_info.get("status") != "STARTED")
-            self.leave_btn.setEnabled(ride_info.get("status") != "STARTED")
+            self.leave_btn.setVisible(not started)
+            self.leave_btn.setEnabled(not started and self.leave_btn not in self._in_flight)
         else:
             self.leave_btn.setVisible(False)
         # Determine partner display. For passengers show their driver; for drivers show
         # a summary of current passengers (avoid showing a single "first" passenger).
-        partner = None
-        if role == 'driver':
-            # Try to fetch all accepted/started rides for this driver and list passenger names
-            api = self.app_state.get('api')
-            user_id = self.app_state.get('user_id')
-            passengers = []
-            if api and user_id:
-                try:
-                    resp = api.fetch_rides(user_id)
-                    rides = resp.get('payload', {}).get('rides', [])
-                    # collect partner names for rides where this user is driver and status is ACCEPTED or STARTED
-                    for r in rides:
-                        if r.get('role') == 'driver' and r.get('status') in ("ACCEPTED", "STARTED"):
-                            name = r.get('partner_name') or r.get('passenger_name') or r.get('partner_username')
-                            if name:
-                                passengers.append(name)
-                except Exception:
-                    passengers = []
-            if passengers:
-                if len(passengers) == 1:
-                    partner = passengers[0]
-                else:
-                    partner = f"Passengers ({len(passengers)}): {', '.join(passengers)}"
-            else:
-                # Fallback to ride_info fields if fetch failed or no passengers found
-                partner = ride_info.get('partner_name') or ride_info.get('accepted_by') or 'Passengers'
+        if is_driver:
+            # Show the fallback until the passenger summary arrives (or if it is empty)
+            partner = self._get_passengers(ride_info) or partner_name or accepted_by or 'Passengers'
         else:
             # passenger view — show the driver name if available
-            partner = ride_info.get('partner_name') or ride_info.get('accepted_by') or ride_info.get('partner_username') or 'Driver'
+            partner = partner_name or accepted_by or ride_info.get('partner_username') or 'Driver'
 
         # Determine a sensible destination string. Prefer explicit 'place', then 'area',
-        # then try to infer from 'direction' (e.g. contains 'University'), otherwise default.
-        place = ride_info.get('place')
-        if not place:
-            place = ride_info.get('area')
+        # then try to infer from 'direction' (e.g. contains 'University'), otherwise
+        # prefer the driver's area from app_state when available.
+        place = ride_info.get('place') or ride_info.get('area')
         if not place:
             direction = (ride_info.get('direction') or "").lower()
-            if 'university' in direction or 'to university' in direction:
+            if 'university' in direction:
                 place = 'to university'
-            elif 'from university' in direction:
-                place = 'from university'
             else:
-                # Fallback: prefer driver's area from app_state when available
-                place = ride_info.get('area') or self.app_state.get('area') or 'to university'
+                place = self.app_state.get('area') or 'to university'
 
-        s = f"Ride to {place} at {ride_info.get('time')}\nPartner: {partner}\nRole: {role}"
+        self._place = place
+        self._set_info_text(partner)
+
+    def _set_info_text(self, partner):
+        role = self.ride_info.get("role", "passenger")
+        s = f"Ride to {self._place} at {self.ride_info.get('time')}\nPartner: {partner}\nRole: {role}"
         self.info_label.setText(s)
 
+    def _get_passengers(self, ride_info):
+        """Return the cached passenger summary, or None after scheduling a refetch."""
+        api = self.app_state.get('api')
+        user_id = self.app_state.get('user_id')
+        if not api or not user_id:
+            return None
+        key = (user_id, ride_info.get('ride_id'))
+        version = self.app_state.get('rides_version', 0)
+        cached = self._passenger_cache.get(key)
+        if cached:
+            names, fetched_at, cached_version = cached
+            if cached_version == version and time.monotonic() - fetched_at < PASSENGER_CACHE_TTL:
+                return self._passenger_summary(names)
+        run_in_background(self._fetch_passengers, api, user_id,
+                          on_finished=lambda names, error: self._on_passengers_loaded(ride_info, key, version, names, error))
+        return None
+
+    def _bump_rides_version(self):
+        """Invalidate cached passenger lists after this client changed a ride."""
+        self.app_state['rides_version'] = self.app_state.get('rides_version', 0) + 1
+
+    @staticmethod
+    def _passenger_summary(passengers):
+        if not passengers:
+            return None
+        if len(passengers) == 1:
+            return passengers[0]
+        return f"Passengers ({len(passengers)}): {', '.join(passengers)}"
+
+    @staticmethod
+    def _fetch_passengers(api, user_id):
+        """Runs on a worker thread: names of passengers on this driver's active rides."""
+        resp = api.fetch_rides(user_id)
+        rides = resp.get('payload', {}).get('rides', [])
+        passengers = []
+        # collect partner names for rides where this user is driver and status is ACCEPTED or STARTED
+        for r in rides:
+            if r.get('role') == 'driver' and r.get('status') in ("ACCEPTED", "STARTED"):
+                name = r.get('partner_name') or r.get('passenger_name') or r.get('partner_username')
+                if name:
+                    passengers.append(name)
+        return passengers
+
+    def _on_passengers_loaded(self, ride_info, key, version, passengers, error):
+        if error is not None:
+            return
+        self._passenger_cache[key] = (passengers, time.monotonic(), version)
+        partner = self._passenger_summary(passengers)
+        # Ignore stale results if another ride was loaded in the meantime
+        if partner and ride_info is self.ride_info:
+            self._set_info_text(partner)
+
+    def _begin_request(self, btn):
+        """Disable `btn` before any work; return False if its request is already in flight."""
+        if btn in self._in_flight:
+            return False
+        self._in_flight.add(btn)
+        btn.setEnabled(False)
+        return True
+
+    def _end_request(self, btn, enable):
+        self._in_flight.discard(btn)
+        if enable:
+            btn.setEnabled(True)
+
     def start_ride(self):
         if self.ride_info.get("role") != "driver":
             return
+        if not self._begin_request(self.start_btn):
+            return
         api = self.app_state.get("api")
         ride_id = self.ride_info.get("ride_id")
         if not api or not ride_id:
+            self._end_request(self.start_btn, True)
             QMessageBox.warning(self, "No ride", "Cannot start ride without an active ride.")
             return
-        try:
-            api.start_ride(ride_id)
-        except ApiClientError as exc:
-            QMessageBox.critical(self, "Unable to start", str(exc))
+        run_in_background(api.start_ride, ride_id, on_finished=self._on_start_finished)
+
+    def _on_start_finished(self, resp, error):
+        started = error is None and resp.get("type") == "START_RIDE_OK"
+        # Keep start button disabled on success so it cannot be clicked again
+        self._end_request(self.start_btn, not started)
+        if error is not None:
+            QMessageBox.critical(self, "Unable to start", str(error))
+            return
+        if not started:
+            QMessageBox.warning(self, "Unable to start", resp.get("payload", {}).get("reason", "Unknown reason"))
             return
+        self._bump_rides_version()
         QMessageBox.information(self, "Ride started", "Ride marked as started.")
         self.ride_started = True
-        # Disable start button so it cannot be clicked again
-        self.start_btn.setEnabled(False)
         self.start_btn.setText("Started")
         self.end_btn.setEnabled(True)  # Enable end button once ride is started
 
     def end_ride(self):
+        if not self._begin_request(self.end_btn):
+            return
         api = self.app_state.get("api")
         ride_id = self.ride_info.get("ride_id")
         if not api or not ride_id:
+            self._end_request(self.end_btn, True)
             QMessageBox.warning(self, "No ride", "Cannot end ride without an active ride.")
             return
-        try:
-            api.complete_ride(ride_id)
-        except ApiClientError as exc:
-            QMessageBox.critical(self, "Unable to end ride", str(exc))
+        run_in_background(api.complete_ride, ride_id, on_finished=self._on_end_finished)
+
+    def _on_end_finished(self, resp, error):
+        ended = error is None and resp.get("type") == "COMPLETE_RIDE_OK"
+        self._end_request(self.end_btn, not ended)
+        if error is not None:
+            QMessageBox.critical(self, "Unable to end ride", str(error))
+            return
+        if not ended:
+            QMessageBox.warning(self, "Unable to end ride", resp.get("payload", {}).get("reason", "Unknown reason"))
             return
+        self._bump_rides_version()
         QMessageBox.information(self, "Ride ended", "Ride marked as completed.")
         # Reset buttons for next time
-        self.end_btn.setEnabled(False)
         self.start_btn.setEnabled(True)
         self.start_btn.setText("Start Ride")
         self.ride_started = False
@@ -158,21 +229,27 @@ class ProgressPage(QWidget):
 
     def leave_ride(self):
         """Called by passenger to leave/cancel before ride start."""
+        if not self._begin_request(self.leave_btn):
+            return
         api = self.app_state.get("api")
         ride_id = self.ride_info.get("ride_id")
         if not api or not ride_id:
+            self._end_request(self.leave_btn, True)
             QMessageBox.warning(self, "No ride", "Cannot leave ride without an active ride.")
             return
-        try:
-            resp = api.cancel_ride(ride_id)
-        except ApiClientError as exc:
-            QMessageBox.critical(self, "Unable to leave", str(exc))
+        run_in_background(api.cancel_ride, ride_id, on_finished=self._on_leave_finished)
+
+    def _on_leave_finished(self, resp, error):
+        left = error is None and resp.get("type") == "CANCEL_RIDE_OK"
+        self._end_request(self.leave_btn, not left)
+        if error is not None:
+            QMessageBox.critical(self, "Unable to leave", str(error))
             return
-        if resp.get("type") == "CANCEL_RIDE_OK":
+        if left:
+            self._bump_rides_version()
             QMessageBox.information(self, "Left ride", "You left the ride.")
             # Reset UI
             self.leave_btn.setVisible(False)
-            self.leave_btn.setEnabled(False)
             if self.on_ride_end:
                 self.on_ride_end()
         else:
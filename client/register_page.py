@@ -3,13 +3,22 @@
 # Contains logo, name, email, password, password confirmation, and Register button.
 # Basic client-side validation is included (matching passwords, simple email check).
 
+from collections import defaultdict
 from PyQt5.QtWidgets import QWidget, QVBoxLayout, QLabel, QLineEdit, QPushButton, QMessageBox, QHBoxLayout, QRadioButton, QGridLayout, QComboBox # type: ignore
 from PyQt5.QtGui import QFont # type: ignore
-from PyQt5.QtCore import Qt # type: ignore
-from .logo_widget import get_logo_label, AUBUS_MAROON
+from PyQt5.QtCore import Qt, QTimer # type: ignore
+from .logo_widget import get_logo_label
 from .validators import is_valid_email
 from .ui_styles import style_button, set_title_label, style_input
-from .api_client import ApiClientError
+from .workers import run_in_background
+from .navigation import page_index
+from .roles import set_role
+from .models import AREA_INDEX, AREA_PLACEHOLDER, DAYS, DIRECTIONS, areas_model, time_slots_model
+
+# Weekdays and route labels of the driver schedule grid. The label is what the
+# server stores as the schedule direction.
+_SCHEDULE_DAYS = DAYS[:5]
+_ROUTE_LABELS = DIRECTIONS
 
 class RegisterPage(QWidget):
     def __init__(self, parent_stack=None, app_state=None):
@@ -65,13 +74,9 @@ class RegisterPage(QWidget):
 
         # Area input (for drivers) - use controlled dropdown to avoid typos
         self.area_input = QComboBox()
-        areas = ["-- Select Area --", "Beirut", "Batroun", "Tripoli", "Saida", "Baalbek", "Zahle", "Nabatieh", "Metn"]
-        self.area_input.addItems(areas)
+        self.area_input.setModel(areas_model())
         # If app_state already has an area, pre-select it
-        current_area = self.app_state.get('area') or "-- Select Area --"
-        idx = self.area_input.findText(current_area)
-        if idx >= 0:
-            self.area_input.setCurrentIndex(idx)
+        self.area_input.setCurrentIndex(AREA_INDEX.get(self.app_state.get('area'), 0))
         self.area_input.setVisible(True)
         self.area_input.setFixedWidth(300)
         layout.addWidget(self.area_input, alignment=Qt.AlignCenter)
@@ -86,18 +91,25 @@ class RegisterPage(QWidget):
         layout.addLayout(role_layout)
 
 
-        # Schedule widget (hidden by default)
-        self.schedule_widget = self._create_schedule_grid()
-        self.schedule_widget.setVisible(False)
-        layout.addWidget(self.schedule_widget)
+        # Schedule widget is only built the first time "Driver" is selected
+        self.schedule_widget = None
+        self._schedule_cells = []  # (day, route label, combo) for every grid cell
+        self._form_layout = layout
+        self._schedule_slot_index = layout.count()
+        self._is_driver = False  # mirrors driver_radio, kept current by its toggled signal
+        self.driver_radio.toggled.connect(self._on_driver_toggled)
 
-        self.driver_radio.toggled.connect(self.schedule_widget.setVisible)
+        # Inline field-level error (cheaper and less disruptive than a modal warning)
+        self._error_label = QLabel("")
+        self._error_label.setStyleSheet("color: #b00;")
+        self._error_label.setVisible(False)
+        layout.addWidget(self._error_label, alignment=Qt.AlignCenter)
 
         # Register button
-        register_btn = QPushButton("Register")
-        register_btn.clicked.connect(self.on_register_clicked)
-        style_button(register_btn)
-        layout.addWidget(register_btn, alignment=Qt.AlignCenter)
+        self.register_btn = QPushButton("Register")
+        self.register_btn.clicked.connect(self.on_register_clicked)
+        style_button(self.register_btn)
+        layout.addWidget(self.register_btn, alignment=Qt.AlignCenter)
 
         # Wrap centered layout with horizontal padding
         h_layout = QHBoxLayout()
@@ -108,139 +120,216 @@ class RegisterPage(QWidget):
         outer.addLayout(h_layout)
         outer.addStretch()
 
-        # Simple styling that matches maroon palette
-        self.setStyleSheet(f"""
-            QLabel{{ color: {AUBUS_MAROON}; }}
-            QPushButton {{ background-color: white; border-radius: 6px; padding: 8px; }}
-        """)
-
         self.setLayout(outer)
 
-    def _generate_time_slots(self):
-        slots = []
-        for hour in range(24):
-            for minute in range(0, 60, 15):
-                slots.append(f"{hour:02d}:{minute:02d}")
-        return slots
+        # Live validation: re-check the form at most once per 200ms while the user types
+        self._registering = False
+        self._last_values = None  # form values from the last validation run
+        self._last_error = None
+        self._edited = set()  # positions in _form_values() of the fields the user has changed
+        self._held_msgboxes = []  # non-modal warnings stay referenced until closed
+        self._debounce = QTimer(self)
+        self._debounce.setSingleShot(True)
+        self._debounce.setInterval(200)
+        self._debounce.timeout.connect(self._revalidate)
+        for i, field in enumerate((self.name_input, self.email_input, self.password_input, self.password_confirm)):
+            field.textChanged.connect(lambda *_, i=i: self._field_edited(i))
+        self.area_input.currentIndexChanged.connect(lambda *_: self._field_edited(4))
+        self._revalidate()
+
+    def _field_edited(self, index):
+        self._edited.add(index)
+        self._debounce.start()
+
+    def _on_driver_toggled(self, checked):
+        self._is_driver = checked
+        if checked and self.schedule_widget is None:
+            self.schedule_widget = self._create_schedule_grid()
+            self._form_layout.insertWidget(self._schedule_slot_index, self.schedule_widget)
+        if self.schedule_widget is not None:
+            self.schedule_widget.setVisible(checked)
 
     def _create_schedule_grid(self):
+        # Populate with updates off and the widget hidden so the grid is laid out once at the end
         schedule_widget = QWidget()
-        grid_layout = QGridLayout()
+        schedule_widget.setVisible(False)
+        schedule_widget.setUpdatesEnabled(False)
+        grid_layout = QGridLayout(schedule_widget)
         grid_layout.setSpacing(10)
-
-        days = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday"]
-        self.routes = {"To University": "area_to_uni", "From University": "uni_to_area"}
-        route_labels = list(self.routes.keys())
+        grid_layout.setContentsMargins(0, 0, 0, 0)
+        grid_layout.setColumnStretch(1, 1)
+        grid_layout.setColumnStretch(2, 1)
 
         # Header
         grid_layout.addWidget(QLabel("Day"), 0, 0)
-        grid_layout.addWidget(QLabel(route_labels[0]), 0, 1)
-        grid_layout.addWidget(QLabel(route_labels[1]), 0, 2)
+        grid_layout.addWidget(QLabel(_ROUTE_LABELS[0]), 0, 1)
+        grid_layout.addWidget(QLabel(_ROUTE_LABELS[1]), 0, 2)
 
-        time_slots = self._generate_time_slots()
-        self.schedule_inputs = {}
+        # All time combos share one model instead of each holding its own copy of the slots
+        slots_model = time_slots_model()
+        self._schedule_cells = []
 
-        for i, day in enumerate(days):
+        for i, day in enumerate(_SCHEDULE_DAYS):
             grid_layout.addWidget(QLabel(day), i + 1, 0)
-            for j, route in enumerate(route_labels):
+            for j, route in enumerate(_ROUTE_LABELS):
                 combo = QComboBox()
-                combo.addItems(["-"] + time_slots)
+                combo.setModel(slots_model)
                 grid_layout.addWidget(combo, i + 1, j + 1)
-                self.schedule_inputs[(day, route)] = combo
+                self._schedule_cells.append((day, route, combo))
 
-        schedule_widget.setLayout(grid_layout)
+        schedule_widget.setUpdatesEnabled(True)
         return schedule_widget
 
+    def _form_values(self):
+        """Read every field once: (name, email, password, confirmation, area)."""
+        return (self.name_input.text().strip(), self.email_input.text().strip(),
+                self.password_input.text(), self.password_confirm.text(),
+                self.area_input.currentText().strip())
+
+    def _check_form(self, values):
+        """Validate `values`, reusing the previous result when nothing effectively changed."""
+        if values != self._last_values:
+            self._last_values = values
+            self._last_error = self._validation_error(*values)
+        return self._last_error
+
+    def _validation_error(self, name, email, pw, pw2, area):
+        """Return (title, message, fields) for the first failing field check, or None if the form is valid.
+
+        `fields` are the positions in _form_values() the error is about.
+        """
+        missing = {i for i, value in enumerate((name, email, pw, pw2)) if not value}
+        if missing:
+            return "Missing fields", "Please fill all fields.", missing
+        if not is_valid_email(email):
+            return "Invalid email", "Please enter a valid email address.", {1}
+        if pw != pw2:
+            return "Password mismatch", "Passwords do not match.", {3}
+        if not area or area == AREA_PLACEHOLDER:
+            return "Area required", "Please select your area from the list.", {4}
+        return None
+
+    def _revalidate(self):
+        """Debounced check that enables Register only when the form would pass validation.
+
+        The reason it is disabled is shown once the user has edited a field the error is about.
+        """
+        error = self._check_form(self._form_values())
+        self.register_btn.setEnabled(not self._registering and error is None)
+        if error is not None and error[2] & self._edited:
+            self._show_error(error[1])
+        else:
+            self._error_label.setVisible(False)
+
+    def _nonmodal_warn(self, title, text):
+        """Show a warning without starting a nested event loop."""
+        mb = QMessageBox(self)
+        mb.setIcon(QMessageBox.Warning)
+        mb.setWindowTitle(title)
+        mb.setText(text)
+        mb.setWindowModality(Qt.NonModal)
+        mb.finished.connect(lambda _result: self._held_msgboxes.remove(mb))
+        self._held_msgboxes.append(mb)
+        mb.show()
+
+    def _show_error(self, message):
+        self._error_label.setText(message)
+        self._error_label.setVisible(True)
+
+    def _set_registering(self, registering):
+        self._registering = registering
+        self._revalidate()
+
     def on_register_clicked(self):
         # Basic validation only
-        name = self.name_input.text().strip()
-        email = self.email_input.text().strip()
-        pw = self.password_input.text()
-        pw2 = self.password_confirm.text()
+        values = self._form_values()
+        name, email, pw, pw2, area = values
 
-        if not name or not email or not pw or not pw2:
-            QMessageBox.warning(self, "Missing fields", "Please fill all fields.")
+        error = self._check_form(values)
+        if error:
+            self._show_error(error[1])
             return
+        self._error_label.setVisible(False)
 
-        if not is_valid_email(email):
-            QMessageBox.warning(self, "Invalid email", "Please enter a valid email address.")
-            return
-
-        if pw != pw2:
-            QMessageBox.warning(self, "Password mismatch", "Passwords do not match.")
-            return
-
-        role = "driver" if self.driver_radio.isChecked() else "passenger"
-        area = self.area_input.currentText().strip()
+        is_driver = self._is_driver
         schedule = None
 
-        if not area or area == "-- Select Area --":
-            QMessageBox.warning(self, "Area required", "Please select your area from the list.")
-            return
-
-        if role == "driver":
-            schedule = {}
-            for (day, route), combo in self.schedule_inputs.items():
+        if is_driver and self.schedule_widget is not None:
+            days = defaultdict(dict)
+            for day, route, combo in self._schedule_cells:
                 time = combo.currentText()
                 if time != "-":
-                    if day not in schedule:
-                        schedule[day] = {}
-                    schedule[day][route] = time
+                    days[day][route] = time
+            schedule = dict(days)
 
         api = self.app_state.get("api")
         if not api:
             QMessageBox.critical(self, "Configuration error", "API client not initialized.")
             return
 
-        try:
-            response = api.register(name=name, email=email, username=email, password=pw, role=role, area=area, schedule=schedule)
-        except ApiClientError as exc:
-            QMessageBox.critical(self, "Registration failed", str(exc))
+        # Register and auto-login run on worker threads; the button stays disabled until done.
+        self._set_registering(True)
+        run_in_background(api.register, name=name, email=email, username=email, password=pw,
+                          role="driver" if is_driver else "passenger", area=area, schedule=schedule,
+                          on_finished=lambda response, error: self._on_registered(api, email, pw, response, error))
+
+    def _on_registered(self, api, email, pw, response, error):
+        if error is not None:
+            self._set_registering(False)
+            QMessageBox.critical(self, "Registration failed", str(error))
             return
 
         if response.get("type") != "REGISTER_OK":
+            self._set_registering(False)
             reason = ""
             payload = response.get("payload") or {}
             if payload.get("reason"):
                 reason = f": {payload['reason']}"
-            QMessageBox.warning(self, "Registration failed", f"Could not register{reason}.")
+            self._nonmodal_warn("Registration failed", f"Could not register{reason}.")
             return
 
         # Automatically log the user in after registration so we have the user profile.
-        try:
-            login_resp = api.login(username=email, password=pw)
-        except ApiClientError as exc:
-            QMessageBox.warning(self, "Registered", f"Account created, but automatic login failed: {exc}. Please log in manually.")
+        run_in_background(api.login, username=email, password=pw, on_finished=self._on_logged_in)
+
+    def _on_logged_in(self, login_resp, error):
+        self._set_registering(False)
+        if error is not None:
+            self._nonmodal_warn("Registered", f"Account created, but automatic login failed: {error}. Please log in manually.")
             return
 
         if login_resp.get("type") != "LOGIN_OK" or not login_resp.get("payload"):
-            QMessageBox.warning(self, "Registered", "Account created, but login failed. Please try signing in manually.")
+            self._nonmodal_warn("Registered", "Account created, but login failed. Please try signing in manually.")
             return
-
-        user = login_resp["payload"]
-        self.app_state['authenticated'] = True
-        self.app_state['user_id'] = user.get("user_id")
-        self.app_state['name'] = user.get("name")
-        self.app_state['email'] = user.get("email")
-        self.app_state['is_driver'] = user.get("is_driver")
-        self.app_state['area'] = user.get("area")
-        self.app_state['username'] = user.get("username")
-        self.app_state['role_selected'] = user.get("role_selected", False)
-        self.app_state['role'] = "driver" if user.get("is_driver") else "passenger"
-
-        QMessageBox.information(self, "Registered", "Registration succeeded. Redirecting...")
+        self._finalize_login(login_resp["payload"])
+
+    def _finalize_login(self, user):
+        """Store the logged-in user and navigate; the only place touching app_state/parent_stack."""
+        is_driver = user.get("is_driver")
+        self.app_state.update({
+            'authenticated': True,
+            'user_id': user.get("user_id"),
+            'name': user.get("name"),
+            'email': user.get("email"),
+            'is_driver': is_driver,
+            'area': user.get("area"),
+            'username': user.get("username"),
+            'role_selected': user.get("role_selected", False),
+        })
+        set_role(self.app_state, "driver" if is_driver else "passenger")
+
+        # Navigate first, then show the confirmation once control is back in the event loop
+        # so the modal dialog does not hold up the redirect.
+        parent = self
         if self.parent_stack:
-            if self.app_state['role_selected']:
-                main_page = self.parent_stack.findChild(QWidget, "MainPage")
-                if main_page:
-                    self.parent_stack.setCurrentIndex(self.parent_stack.indexOf(main_page))
-            else:
-                preliminary = self.parent_stack.findChild(QWidget, "PreliminaryPage")
-                if preliminary:
-                    self.parent_stack.setCurrentIndex(self.parent_stack.indexOf(preliminary))
+            index = page_index(self.parent_stack, "MainPage" if self.app_state['role_selected'] else "PreliminaryPage")
+            if index >= 0:
+                self.parent_stack.setCurrentIndex(index)
+                parent = self.parent_stack.currentWidget()
+        QTimer.singleShot(0, lambda: QMessageBox.information(parent, "Registered", "Registration succeeded."))
 
     def reset_form(self):
         """Clear all form inputs."""
+        self._error_label.setVisible(False)
         self.name_input.clear()
         self.email_input.clear()
         self.password_input.clear()
@@ -250,3 +339,4 @@ class RegisterPage(QWidget):
             self.area_input.setCurrentIndex(0)
         except Exception:
             pass
+        self._edited.clear()
@@ -5,11 +5,112 @@ the main hub. Handles creating ride requests and accepting offers.
 """
 
 from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QLabel, QLineEdit, QSpinBox,
-                             QPushButton, QListWidget, QListWidgetItem, QHBoxLayout, QMessageBox, QRadioButton, QComboBox, QDialog, QListView)  # type: ignore
-from PyQt5.QtCore import Qt  # type: ignore
+                             QPushButton, QListWidget, QHBoxLayout, QMessageBox, QRadioButton, QComboBox, QDialog, QListView)  # type: ignore
+from PyQt5.QtCore import Qt, QAbstractListModel, QModelIndex  # type: ignore
+from PyQt5.QtGui import QColor  # type: ignore
+from collections import OrderedDict
 from datetime import datetime
+from operator import itemgetter
 from .ui_styles import style_button, set_title_label, style_input
 from .api_client import ApiClientError
+from .workers import run_in_background
+from .roles import ROLE_REV_KEY
+from .models import DAYS
+
+# Item data role holding the driver's local response ("denied") for a request row
+RESPONSE_ROLE = Qt.UserRole + 1
+DENIED_BACKGROUND = QColor("#ffe8e8")
+# How many handled DRIVER_RESPONSE (ride_id, status) pairs to remember for de-duplication
+HANDLED_RESPONSES_MAX = 128
+# Fields shown in a driver request row, pulled in one call
+_request_fields = itemgetter('passenger_name', 'direction', 'time')
+# Row text for a driver's accepted/started ride
+_RIDE_ROW_TMPL = "%s - %s %s - %s"
+
+
+def _ride_row_text(r):
+    get = r.get
+    return _RIDE_ROW_TMPL % (get('partner_name') or 'Passenger', get('day'), get('time'), get('status'))
+
+
+def _fill_ride_list(list_widget, rides):
+    """Replace `list_widget` rows with `rides`, repainting once (or not at all if it stays empty)."""
+    if not rides and not list_widget.count():
+        return
+    list_widget.setUpdatesEnabled(False)
+    try:
+        list_widget.clear()
+        list_widget.addItems([_ride_row_text(r) for r in rides])
+        for row, r in enumerate(rides):
+            list_widget.item(row).setData(Qt.UserRole, r)
+    finally:
+        list_widget.setUpdatesEnabled(True)
+
+
+class RideRequestModel(QAbstractListModel):
+    """Driver ride requests as plain dicts; row text and denied marking come from data()."""
+
+    def __init__(self, denied_ride_ids, parent=None):
+        super().__init__(parent)
+        self._rows = []
+        self._labels = []
+        # ride_id -> row, so lookups and RIDE_UNAVAILABLE removals skip a scan
+        self._row_of = {}
+        # Shared with RideTab so a denial shows up without copying rows
+        self._denied = denied_ride_ids
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row = index.row()
+        if role == Qt.DisplayRole:
+            return self._labels[row]
+        if role == Qt.UserRole:
+            return self._rows[row]
+        if self._rows[row]["ride_id"] in self._denied:
+            if role == Qt.BackgroundRole:
+                return DENIED_BACKGROUND
+            if role == RESPONSE_ROLE:
+                return "denied"
+        return None
+
+    def reset(self, rows):
+        """Replace all rows with one model reset."""
+        self.beginResetModel()
+        self._rows = list(rows)
+        self._labels = ["Passenger: %s - %s at %s" % _request_fields(req) for req in self._rows]
+        self._row_of = {req["ride_id"]: row for row, req in enumerate(self._rows)}
+        self.endResetModel()
+
+    def ride_at(self, row):
+        if 0 <= row < len(self._rows):
+            return self._rows[row]
+        return None
+
+    def row_of(self, ride_id):
+        return self._row_of.get(ride_id, -1)
+
+    def remove_ride(self, ride_id):
+        row = self._row_of.pop(ride_id, None)
+        if row is None:
+            return
+        self.beginRemoveRows(QModelIndex(), row, row)
+        del self._rows[row]
+        del self._labels[row]
+        # Rows below the removed one move up by one
+        for ride in self._rows[row:]:
+            self._row_of[ride["ride_id"]] -= 1
+        self.endRemoveRows()
+
+    def ride_changed(self, ride_id):
+        """Repaint the row for `ride_id` after its denied state changed."""
+        row = self.row_of(ride_id)
+        if row >= 0:
+            index = self.index(row)
+            self.dataChanged.emit(index, index, [Qt.BackgroundRole, RESPONSE_ROLE])
 
 
 class RideTab(QWidget):
@@ -24,24 +125,53 @@ class RideTab(QWidget):
         self.driver_results = []
         self.pending_passenger_requests = {}
         self.pending_driver_requests = {}
+        # Denied requests stay offered to other drivers, so the server keeps listing them
+        self.denied_ride_ids = set()
+        # Outlives the list view, which is rebuilt with the role UI
+        self._requests_model = RideRequestModel(self.denied_ride_ids, self)
+        # A driver-requests fetch is running; `_requests_stale` asks for one more when it lands
+        self._requests_loading = False
+        self._requests_stale = False
+        # Bumped on role rebuilds and hides so fetches started before then are ignored
+        self._refresh_seq = 0
+        self._responding = False
+        self._broadcasting = False
+        # (ride_id, status) of DRIVER_RESPONSE events already shown, oldest first
+        self._handled_responses = OrderedDict()
+        # Role whose widgets are currently built; async results only touch widgets of that role
+        self._ui_role = None
+        # (role revision, role) as of the last current_role() read
+        self._role_cache = (None, None)
         self.init_ui()
 
     def init_ui(self):
-        self.setLayout(QVBoxLayout())
+        outer = QVBoxLayout()
+        outer.setContentsMargins(0, 0, 0, 0)
+        self.setLayout(outer)
+        # Role-specific widgets live in one container that is swapped out wholesale
+        self._content = QWidget()
+        self._content.setLayout(QVBoxLayout())
+        outer.addWidget(self._content)
 
     def showEvent(self, event):
         super().showEvent(event)
+        # Rebuilding the role UI refetches driver requests, which covers any skipped refresh
         self.update_ui_for_role()
 
+    def hideEvent(self, event):
+        super().hideEvent(event)
+        self._refresh_seq += 1
+
     def update_ui_for_role(self):
-        # Clear existing widgets
-        layout = self.layout()
-        while layout.count():
-            child = layout.takeAt(0)
-            if child.widget():
-                child.widget().deleteLater()
+        self._refresh_seq += 1
+        # Replace the whole content container instead of deleting its children one by one
+        self._content.deleteLater()
+        self._content = QWidget()
+        layout = QVBoxLayout(self._content)
+        self.layout().addWidget(self._content)
 
         role = self.current_role()
+        self._ui_role = role
         if role == 'passenger':
             self.setup_passenger_ui(layout)
         else:
@@ -79,32 +209,39 @@ class RideTab(QWidget):
         set_title_label(title, size=14)
         layout.addWidget(title)
 
-        self.requests_list = QListWidget()
+        self.requests_list = QListView()
+        self.requests_list.setModel(self._requests_model)
         layout.addWidget(self.requests_list)
 
         btn_row = QHBoxLayout()
-        accept_btn = QPushButton("Accept")
-        accept_btn.clicked.connect(self.on_accept_clicked)
-        style_button(accept_btn, min_height=30)
-        btn_row.addWidget(accept_btn)
+        self.accept_btn = QPushButton("Accept")
+        self.accept_btn.clicked.connect(self.on_accept_clicked)
+        style_button(self.accept_btn, min_height=30)
+        btn_row.addWidget(self.accept_btn)
         # 'Open' removed — drivers should use the 'Current Ride' tab
-        deny_btn = QPushButton("Deny")
-        deny_btn.clicked.connect(self.on_deny_clicked)
-        style_button(deny_btn, min_height=30)
-        btn_row.addWidget(deny_btn)
+        self.deny_btn = QPushButton("Deny")
+        self.deny_btn.clicked.connect(self.on_deny_clicked)
+        style_button(self.deny_btn, min_height=30)
+        btn_row.addWidget(self.deny_btn)
+        self._set_responding(self._responding)
         layout.addLayout(btn_row)
 
         self.refresh_driver_requests()
 
 
     def current_role(self):
-        return self.app_state.get('role', 'passenger')
+        # Role changes bump ROLE_REV_KEY (see roles.set_role); re-read only then
+        rev = self.app_state.get(ROLE_REV_KEY, 0)
+        if self._role_cache[0] != rev:
+            self._role_cache = (rev, self.app_state.get('role', 'passenger'))
+        return self._role_cache[1]
 
     def on_request_ride_clicked(self):
         direction = "To University" if self.from_area_radio.isChecked() else "From University"
         now = datetime.now()
-        day = now.strftime("%A")
-        time = now.strftime("%H:%M")
+        # DAYS is Monday-first like weekday(); avoids strftime's locale-dependent path
+        day = DAYS[now.weekday()]
+        time = f"{now.hour:02d}:{now.minute:02d}"
 
         api = self.app_state.get("api")
         user_id = self.app_state.get("user_id")
@@ -113,12 +250,25 @@ class RideTab(QWidget):
             QMessageBox.warning(self, "Not ready", "Please log in again or ensure your area is set.")
             return
 
-        try:
-            response = api.broadcast_ride_request(passenger_id=user_id, direction=direction, day=day, time=time, area=area) # Pass area to API call
-        except ApiClientError as exc:
-            QMessageBox.critical(self, "Request failed", str(exc))
+        # The server enumerates candidate drivers before answering; keep the UI responsive meanwhile
+        self._broadcasting = True
+        self.request_btn.setEnabled(False)
+        self.status_label.setText("Sending request to available drivers...")
+        self.status_label.setVisible(True)
+        run_in_background(api.broadcast_ride_request, passenger_id=user_id, direction=direction, day=day, time=time, area=area,
+                          on_finished=self._on_broadcast_finished)
+
+    def _on_broadcast_finished(self, response, error):
+        self._broadcasting = False
+        if self._ui_role != 'passenger':
+            # Role UI was rebuilt meanwhile; its widgets are gone
             return
-        
+        if error is not None:
+            self.status_label.setVisible(False)
+            QMessageBox.critical(self, "Request failed", str(error))
+            self.request_btn.setEnabled(True)
+            return
+
         if response.get("type") == "BROADCAST_OK":
             self.status_label.setText("Request sent to available drivers. Waiting for responses...")
             self.status_label.setVisible(True)
@@ -126,6 +276,7 @@ class RideTab(QWidget):
             if hasattr(self, 'request_btn'):
                 self.request_btn.setEnabled(False)
         elif response.get("type") == "NO_DRIVERS_FOUND":
+            self.status_label.setVisible(False)
             QMessageBox.information(self, "No drivers", "No available drivers found for the next 15 minutes.")
             # Allow the passenger to try again immediately
             if hasattr(self, 'request_btn'):
@@ -135,13 +286,12 @@ class RideTab(QWidget):
 
 
     def on_accept_clicked(self):
-        item = self.requests_list.currentItem()
-        if not item:
-            QMessageBox.information(self, "Select one", "Please select a request to accept.")
+        if self._responding:
+            # A response is already on its way; don't send a second one
             return
-        
-        ride = item.data(Qt.UserRole)
+        ride = self._selected_request()
         if not ride:
+            QMessageBox.information(self, "Select one", "Please select a request to accept.")
             return
 
         api = self.app_state.get("api")
@@ -150,10 +300,13 @@ class RideTab(QWidget):
             QMessageBox.warning(self, "Not ready", "Please log in again.")
             return
 
-        try:
-            response = api.respond_to_ride(ride["ride_id"], "ACCEPTED")
-        except ApiClientError as exc:
-            QMessageBox.critical(self, "Unable to respond", str(exc))
+        self._set_responding(True)
+        run_in_background(api.respond_to_ride, ride["ride_id"], "ACCEPTED", on_finished=self._on_accept_finished)
+
+    def _on_accept_finished(self, response, error):
+        self._set_responding(False)
+        if error is not None:
+            QMessageBox.critical(self, "Unable to respond", str(error))
             return
 
         if response.get("payload", {}).get("status") == "ACCEPTED":
@@ -181,9 +334,11 @@ class RideTab(QWidget):
         if not api or not driver_id:
             QMessageBox.warning(self, "Not ready", "Please log in again.")
             return
-        try:
-            resp = api.fetch_rides(driver_id)
-        except ApiClientError:
+        run_in_background(api.fetch_rides, driver_id,
+                          on_finished=lambda resp, error: self._on_open_rides_loaded(api, resp, error))
+
+    def _on_open_rides_loaded(self, api, resp, error):
+        if error is not None:
             QMessageBox.warning(self, "Unable to open", "Could not load your rides.")
             return
         rides = resp.get("payload", {}).get("rides", [])
@@ -193,46 +348,81 @@ class RideTab(QWidget):
         dlg.exec_()
 
     def on_deny_clicked(self):
-        item = self.requests_list.currentItem()
-        if not item:
-            QMessageBox.information(self, "Select one", "Please select a request to deny.")
+        if self._responding:
             return
-
-        ride = item.data(Qt.UserRole)
+        ride = self._selected_request()
         if not ride:
+            QMessageBox.information(self, "Select one", "Please select a request to deny.")
             return
-            
+
         api = self.app_state.get("api")
         driver_id = self.app_state.get("user_id")
         if not api or not driver_id:
             QMessageBox.warning(self, "Not ready", "Please log in again.")
             return
 
-        try:
-            api.respond_to_ride(ride["ride_id"], "DENIED")
-        except ApiClientError as exc:
-            QMessageBox.critical(self, "Unable to deny", str(exc))
-        
-        self.refresh_driver_requests()
+        ride_id = ride["ride_id"]
+        self._set_responding(True)
+        run_in_background(api.respond_to_ride, ride_id, "DENIED",
+                          on_finished=lambda _response, error: self._on_deny_finished(ride_id, error))
+
+    def _on_deny_finished(self, ride_id, error):
+        self._set_responding(False)
+        if error is not None:
+            QMessageBox.critical(self, "Unable to deny", str(error))
+            self.refresh_driver_requests()
+            return
+
+        # The model reads denied_ride_ids, so only the row's repaint is needed
+        self.denied_ride_ids.add(ride_id)
+        self._requests_model.ride_changed(ride_id)
+
+    def _set_responding(self, responding):
+        """Disable Accept/Deny while a response to the server is in flight."""
+        self._responding = responding
+        if self._ui_role != 'driver':
+            return
+        self.accept_btn.setEnabled(not responding)
+        self.deny_btn.setEnabled(not responding)
+
+    def _selected_request(self):
+        """Return the request dict of the selected row, or None."""
+        if self._ui_role != 'driver':
+            return None
+        return self._requests_model.ride_at(self.requests_list.currentIndex().row())
 
     def refresh_driver_requests(self):
         if self.current_role() != 'driver':
             return
+        if not self.isVisible():
+            # showEvent refetches when the tab is shown again
+            return
         api = self.app_state.get("api")
         user_id = self.app_state.get("user_id")
         if not api or not user_id:
             return
-        try:
-            response = api.fetch_ride_requests(user_id)
-        except ApiClientError:
+        if self._requests_loading:
+            self._requests_stale = True
+            return
+        self._requests_loading = True
+        self._refresh_seq += 1
+        seq = self._refresh_seq
+        run_in_background(api.fetch_ride_requests, user_id,
+                          on_finished=lambda response, error: self._on_driver_requests_loaded(seq, response, error))
+
+    def _on_driver_requests_loaded(self, seq, response, error):
+        self._requests_loading = False
+        if self._requests_stale:
+            # Something changed while this fetch was running; fetch again instead
+            self._requests_stale = False
+            self.refresh_driver_requests()
             return
-        
-        requests = response.get("payload", {}).get("requests", [])
-        self.requests_list.clear()
-        for req in requests:
-            item = QListWidgetItem(f"Passenger: {req['passenger_name']} - {req['direction']} at {req['time']}")
-            item.setData(Qt.UserRole, req)
-            self.requests_list.addItem(item)
+        if seq != self._refresh_seq or self.current_role() != 'driver':
+            # Tab was hidden or the role UI rebuilt since this fetch started
+            return
+        if error is not None or self._ui_role != 'driver':
+            return
+        self._requests_model.reset(response.get("payload", {}).get("requests", []))
 
 
     def handle_event(self, event):
@@ -241,42 +431,25 @@ class RideTab(QWidget):
             if event.type == "RIDE_REQUEST":
                 self.refresh_driver_requests()
             elif event.type == "RIDE_UNAVAILABLE":
-                ride_id = event.payload.get("ride_id")
-                for i in range(self.requests_list.count()):
-                    item = self.requests_list.item(i)
-                    ride = item.data(Qt.UserRole)
-                    if ride and ride["ride_id"] == ride_id:
-                        self.requests_list.takeItem(i)
-                        break
+                self._requests_model.remove_ride(event.payload.get("ride_id"))
         elif role == "passenger":
             if event.type == "DRIVER_RESPONSE":
                 payload = event.payload
+                ride_id = payload.get("ride_id")
                 status = payload.get("status")
+                if not self._first_response(ride_id, status):
+                    return
                 if status == "ACCEPTED":
                     QMessageBox.information(self, "Ride update", "Driver accepted the request.")
                     # Hide waiting label and open progress page for passenger
                     if hasattr(self, 'status_label'):
                         self.status_label.setVisible(False)
                     # Fetch ride info and show progress
-                    ride_id = payload.get("ride_id")
                     api = self.app_state.get("api")
                     user_id = self.app_state.get("user_id")
                     if api and user_id and ride_id:
-                        try:
-                            resp = api.fetch_rides(user_id)
-                            rides = resp.get("payload", {}).get("rides", [])
-                            for r in rides:
-                                if r.get("ride_id") == ride_id:
-                                    # Attach peer connection info from the driver response (if provided)
-                                    r["driver_ip"] = payload.get("driver_ip")
-                                    r["driver_port"] = payload.get("driver_port")
-                                    r["partner_username"] = payload.get("driver_username")
-                                    if self.go_to_progress:
-                                        r["role"] = "passenger"
-                                        self.go_to_progress(r)
-                                    break
-                        except ApiClientError:
-                            pass
+                        run_in_background(api.fetch_rides, user_id,
+                                          on_finished=lambda resp, error: self._on_accepted_ride_loaded(payload, resp, error))
                 elif status == "DENIED":
                     QMessageBox.information(self, "Ride update", "Driver denied the request.")
                     # Allow the passenger to make another request
@@ -286,6 +459,38 @@ class RideTab(QWidget):
 
 
 
+    def _on_accepted_ride_loaded(self, payload, resp, error):
+        """Open the progress page for the ride a DRIVER_RESPONSE accepted."""
+        if error is not None:
+            return
+        ride_id = payload["ride_id"]
+        for r in resp.get("payload", {}).get("rides", []):
+            if r.get("ride_id") == ride_id:
+                # Attach peer connection info from the driver response (if provided)
+                r["driver_ip"] = payload.get("driver_ip")
+                r["driver_port"] = payload.get("driver_port")
+                r["partner_username"] = payload.get("driver_username")
+                if self.go_to_progress:
+                    r["role"] = "passenger"
+                    self.go_to_progress(r)
+                break
+
+    def _first_response(self, ride_id, status):
+        """Record a DRIVER_RESPONSE and return False if it repeats one already handled.
+
+        Another driver may still accept after one denies, so only an acceptance
+        closes out the ride for every later response.
+        """
+        handled = self._handled_responses
+        key = (ride_id, status)
+        if key in handled or (ride_id, "ACCEPTED") in handled:
+            return False
+        if status in ("ACCEPTED", "DENIED"):
+            handled[key] = None
+            if len(handled) > HANDLED_RESPONSES_MAX:
+                handled.popitem(last=False)
+        return True
+
     def reset_form(self):
         """Clear form and matches list."""
         # Clearing widgets may be called when the UI was previously torn down;
@@ -295,11 +500,7 @@ class RideTab(QWidget):
                 self.matches_list.clear()
             except Exception:
                 pass
-        if hasattr(self, 'requests_list'):
-            try:
-                self.requests_list.clear()
-            except Exception:
-                pass
+        self._requests_model.reset([])
         try:
             if getattr(self, 'from_uni_radio', None) is not None:
                 try:
@@ -317,9 +518,17 @@ class RideTab(QWidget):
         user_id = self.app_state.get("user_id")
         if not hasattr(self, 'request_btn') or not api or not user_id:
             return
-        try:
-            resp = api.fetch_rides(user_id)
-        except ApiClientError:
+        if self._broadcasting:
+            # Stay disabled until the pending broadcast answers
+            self.request_btn.setEnabled(False)
+            return
+        run_in_background(api.fetch_rides, user_id, on_finished=self._on_passenger_rides_loaded)
+
+    def _on_passenger_rides_loaded(self, resp, error):
+        if self._ui_role != 'passenger' or self._broadcasting:
+            # The passenger widgets were rebuilt, or a new broadcast owns the button now
+            return
+        if error is not None:
             # conservatively allow requests if we cannot fetch rides
             self.request_btn.setEnabled(True)
             return
@@ -361,11 +570,7 @@ class DriverRideMenu(QDialog):
         self.refresh_list()
 
     def refresh_list(self):
-        self.list.clear()
-        for r in self.rides:
-            item = QListWidgetItem(f"{r.get('partner_name') or 'Passenger'} - {r.get('day')} {r.get('time')} - {r.get('status')}")
-            item.setData(Qt.UserRole, r)
-            self.list.addItem(item)
+        _fill_ride_list(self.list, self.rides)
 
     def selected_ride(self):
         item = self.list.currentItem()
@@ -374,15 +579,26 @@ class DriverRideMenu(QDialog):
             return None
         return item.data(Qt.UserRole)
 
+    def _set_busy(self, busy):
+        """Disable the actions while a request for the selected ride is in flight."""
+        self.start_btn.setEnabled(not busy)
+        self.remove_btn.setEnabled(not busy)
+
     def on_start(self):
         r = self.selected_ride()
         if not r:
             return
-        ride_id = r.get('ride_id')
-        try:
-            self.api.start_ride(ride_id)
-        except ApiClientError as exc:
-            QMessageBox.critical(self, "Unable to start", str(exc))
+        self._set_busy(True)
+        run_in_background(self.api.start_ride, r.get('ride_id'),
+                          on_finished=lambda resp, error: self._on_start_finished(r, resp, error))
+
+    def _on_start_finished(self, r, resp, error):
+        self._set_busy(False)
+        if error is not None:
+            QMessageBox.critical(self, "Unable to start", str(error))
+            return
+        if resp.get('type') != 'START_RIDE_OK':
+            QMessageBox.warning(self, "Unable to start", resp.get('payload', {}).get('reason', 'Unknown'))
             return
         QMessageBox.information(self, "Started", "Ride started for selected passenger.")
         # open progress for this ride
@@ -406,10 +622,14 @@ class DriverRideMenu(QDialog):
         if not r:
             return
         ride_id = r.get('ride_id')
-        try:
-            resp = self.api.cancel_ride(ride_id)
-        except ApiClientError as exc:
-            QMessageBox.critical(self, "Unable to cancel", str(exc))
+        self._set_busy(True)
+        run_in_background(self.api.cancel_ride, ride_id,
+                          on_finished=lambda resp, error: self._on_remove_finished(ride_id, resp, error))
+
+    def _on_remove_finished(self, ride_id, resp, error):
+        self._set_busy(False)
+        if error is not None:
+            QMessageBox.critical(self, "Unable to cancel", str(error))
             return
         if resp.get('type') == 'CANCEL_RIDE_OK':
             QMessageBox.information(self, "Removed", "Passenger removed / ride cancelled.")
@@ -431,13 +651,15 @@ class CurrentRidesTab(QWidget):
         self.init_ui()
 
     def init_ui(self):
-        self.setLayout(QVBoxLayout())
+        outer = QVBoxLayout()
+        outer.setContentsMargins(0, 0, 0, 0)
+        self.setLayout(outer)
         title = QLabel("Current Rides (Accepted)")
         set_title_label(title, size=14)
-        self.layout().addWidget(title)
+        outer.addWidget(title)
 
         self.rides_list = QListWidget()
-        self.layout().addWidget(self.rides_list)
+        outer.addWidget(self.rides_list)
 
         btn_row = QHBoxLayout()
         self.start_btn = QPushButton("Start All")
@@ -453,25 +675,22 @@ class CurrentRidesTab(QWidget):
         self.cancel_btn.clicked.connect(self.on_cancel)
         style_button(self.cancel_btn)
         btn_row.addWidget(self.cancel_btn)
-        self.layout().addLayout(btn_row)
+        outer.addLayout(btn_row)
 
     def refresh_list(self):
         api = self.app_state.get('api')
         user_id = self.app_state.get('user_id')
         if not api or not user_id:
             return
-        try:
-            resp = api.fetch_rides(user_id)
-        except ApiClientError:
+        run_in_background(api.fetch_rides, user_id, on_finished=self._on_rides_loaded)
+
+    def _on_rides_loaded(self, resp, error):
+        if error is not None:
             return
         rides = resp.get('payload', {}).get('rides', [])
         # show only ACCEPTED rides here (once started they'll be removed from this list)
         driver_rides = [r for r in rides if r.get('role') == 'driver' and r.get('status') == 'ACCEPTED']
-        self.rides_list.clear()
-        for r in driver_rides:
-            item = QListWidgetItem(f"{r.get('partner_name') or 'Passenger'} - {r.get('day')} {r.get('time')} - {r.get('status')}")
-            item.setData(Qt.UserRole, r)
-            self.rides_list.addItem(item)
+        _fill_ride_list(self.rides_list, driver_rides)
 
     def selected_ride(self):
         item = self.rides_list.currentItem()
@@ -497,11 +716,15 @@ class CurrentRidesTab(QWidget):
         if not r:
             return
         api = self.app_state.get('api')
-        ride_id = r.get('ride_id')
-        try:
-            resp = api.cancel_ride(ride_id)
-        except ApiClientError as exc:
-            QMessageBox.critical(self, "Unable to cancel", str(exc))
+        if not api:
+            return
+        self._set_busy(True)
+        run_in_background(api.cancel_ride, r.get('ride_id'), on_finished=self._on_cancel_finished)
+
+    def _on_cancel_finished(self, resp, error):
+        self._set_busy(False)
+        if error is not None:
+            QMessageBox.critical(self, "Unable to cancel", str(error))
             return
         if resp.get('type') == 'CANCEL_RIDE_OK':
             QMessageBox.information(self, "Cancelled", "Ride cancelled for that passenger.")
@@ -509,6 +732,31 @@ class CurrentRidesTab(QWidget):
         else:
             QMessageBox.warning(self, "Unable", resp.get('payload', {}).get('reason', 'Unknown'))
 
+    def _set_busy(self, busy):
+        """Disable the actions while a request is in flight."""
+        for btn in (self.start_btn, self.end_btn, self.cancel_btn):
+            btn.setEnabled(not busy)
+
+    @staticmethod
+    def _transition_rides(api, user_id, status, action):
+        """Apply `action` to each of the driver's rides in `status`; runs on the API pool.
+
+        Returns (the rides it was applied to, error messages).
+        """
+        resp = api.fetch_rides(user_id)
+        rides = resp.get('payload', {}).get('rides', [])
+        driver_rides = [r for r in rides if r.get('role') == 'driver' and r.get('status') == status]
+        errors = []
+        for r in driver_rides:
+            try:
+                resp = action(r.get('ride_id'))
+            except ApiClientError as exc:
+                errors.append(str(exc))
+                continue
+            if resp.get('type', '').endswith('_FAIL'):
+                errors.append(resp.get('payload', {}).get('reason', 'Unknown'))
+        return driver_rides, errors
+
     def on_start_all(self):
         """Start all accepted rides for this driver (batch start)."""
         api = self.app_state.get('api')
@@ -516,23 +764,19 @@ class CurrentRidesTab(QWidget):
         if not api or not user_id:
             QMessageBox.warning(self, "Not ready", "Please log in again.")
             return
-        try:
-            resp = api.fetch_rides(user_id)
-        except ApiClientError:
+        self._set_busy(True)
+        run_in_background(self._transition_rides, api, user_id, 'ACCEPTED', api.start_ride,
+                          on_finished=self._on_start_all_finished)
+
+    def _on_start_all_finished(self, result, error):
+        self._set_busy(False)
+        if error is not None:
             QMessageBox.critical(self, "Unable", "Could not fetch rides")
             return
-        rides = resp.get('payload', {}).get('rides', [])
-        driver_rides = [r for r in rides if r.get('role') == 'driver' and r.get('status') == 'ACCEPTED']
+        driver_rides, errors = result
         if not driver_rides:
             QMessageBox.information(self, "No rides", "No accepted rides to start.")
             return
-        errors = []
-        for r in driver_rides:
-            ride_id = r.get('ride_id')
-            try:
-                api.start_ride(ride_id)
-            except ApiClientError as exc:
-                errors.append(str(exc))
         if errors:
             QMessageBox.warning(self, "Partial start", "Some rides could not be started: " + ", ".join(errors))
         else:
@@ -551,23 +795,19 @@ class CurrentRidesTab(QWidget):
         if not api or not user_id:
             QMessageBox.warning(self, "Not ready", "Please log in again.")
             return
-        try:
-            resp = api.fetch_rides(user_id)
-        except ApiClientError:
+        self._set_busy(True)
+        run_in_background(self._transition_rides, api, user_id, 'STARTED', api.complete_ride,
+                          on_finished=self._on_end_all_finished)
+
+    def _on_end_all_finished(self, result, error):
+        self._set_busy(False)
+        if error is not None:
             QMessageBox.critical(self, "Unable", "Could not fetch rides")
             return
-        rides = resp.get('payload', {}).get('rides', [])
-        driver_rides = [r for r in rides if r.get('role') == 'driver' and r.get('status') == 'STARTED']
+        driver_rides, errors = result
         if not driver_rides:
             QMessageBox.information(self, "No rides", "No started rides to end.")
             return
-        errors = []
-        for r in driver_rides:
-            ride_id = r.get('ride_id')
-            try:
-                api.complete_ride(ride_id)
-            except ApiClientError as exc:
-                errors.append(str(exc))
         if errors:
             QMessageBox.warning(self, "Partial complete", "Some rides could not be completed: " + ", ".join(errors))
         else:
@@ -0,0 +1,22 @@
+"""Role bookkeeping on the shared app_state dict.
+
+Role changes go through `set_role`/`clear_role`, which bump `ROLE_REV_KEY`, so
+readers on hot paths can cache the role and only re-read it after a change.
+"""
+
+import itertools
+
+ROLE_REV_KEY = '__role_rev'
+
+# Revisions never repeat, even after app_state is cleared on logout
+_revisions = itertools.count(1)
+
+
+def set_role(app_state, role):
+    app_state['role'] = role
+    app_state[ROLE_REV_KEY] = next(_revisions)
+
+
+def clear_role(app_state):
+    app_state.pop('role', None)
+    app_state[ROLE_REV_KEY] = next(_revisions)
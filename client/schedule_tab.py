@@ -3,6 +3,8 @@
 Allows drivers to add weekly availability entries used by ride matching.
 """
 
+import time
+
 from PyQt5.QtWidgets import (
     QWidget,
     QVBoxLayout,
@@ -15,13 +17,37 @@ from PyQt5.QtWidgets import (
     QTableWidgetItem,
     QMessageBox,
 )  # type: ignore
-from PyQt5.QtCore import Qt  # type: ignore
+from PyQt5.QtCore import Qt, QRegExp  # type: ignore
+from PyQt5.QtGui import QRegExpValidator  # type: ignore
 
 from .ui_styles import set_title_label, style_button, style_input
-from .api_client import ApiClientError
+from .workers import run_in_background
+from .models import AREA_INDEX, AREA_PLACEHOLDER, areas_model, days_model, directions_model
+
+# 24h HH:MM; compiled once and checked per keystroke by the line edit's validator
+TIME_RE = QRegExp(r"^([01]\d|2[0-3]):[0-5]\d$")
+SCHEDULE_CACHE_TTL = 5.0
+
+# key -> (timestamp, payload) for recent API responses
+_cache = {}
+
+
+def cached_call(key, fn, max_age=SCHEDULE_CACHE_TTL):
+    """Return `fn()`, reusing a result for `key` fetched less than `max_age` seconds ago."""
+    hit = _cache.get(key)
+    now = time.monotonic()
+    if hit is not None and now - hit[0] < max_age:
+        return hit[1]
+    payload = fn()
+    _cache[key] = (now, payload)
+    return payload
+
 
-DAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
-DIRECTIONS = ["To University", "From University"]
+def _invalidate(key):
+    _cache.pop(key, None)
+
+
+cached_call.invalidate = _invalidate
 
 
 class ScheduleTab(QWidget):
@@ -29,6 +55,11 @@ class ScheduleTab(QWidget):
         super().__init__()
         self.app_state = app_state or {}
         self.entries = []
+        # Set when a refresh is requested while the tab is off-screen
+        self._dirty = False
+        # A list fetch is running; `_stale` asks for one more when it lands
+        self._loading = False
+        self._stale = False
         self.init_ui()
 
     def init_ui(self):
@@ -43,33 +74,30 @@ class ScheduleTab(QWidget):
         form = QHBoxLayout()
 
         self.day_box = QComboBox()
-        self.day_box.addItems(DAYS)
+        self.day_box.setModel(days_model())
         form.addWidget(self.day_box)
 
         self.time_input = QLineEdit()
         self.time_input.setPlaceholderText("Time (e.g. 08:30)")
+        self.time_input.setValidator(QRegExpValidator(TIME_RE, self.time_input))
         style_input(self.time_input, width=120)
         form.addWidget(self.time_input)
 
         self.direction_box = QComboBox()
-        self.direction_box.addItems(DIRECTIONS)
+        self.direction_box.setModel(directions_model())
         form.addWidget(self.direction_box)
 
         self.area_input = QComboBox()
-        areas = ["-- Select Area --", "Beirut", "Batroun", "Tripoli", "Saida", "Baalbek", "Zahle", "Nabatieh", "Metn"]
-        self.area_input.addItems(areas)
+        self.area_input.setModel(areas_model())
         # preselect app_state area if available
-        current_area = self.app_state.get('area', "-- Select Area --")
-        idx = self.area_input.findText(current_area)
-        if idx >= 0:
-            self.area_input.setCurrentIndex(idx)
+        self.area_input.setCurrentIndex(AREA_INDEX.get(self.app_state.get('area'), 0))
         style_input(self.area_input, width=160)
         form.addWidget(self.area_input)
 
-        add_btn = QPushButton("Add")
-        add_btn.clicked.connect(self.add_entry)
-        style_button(add_btn, min_height=28)
-        form.addWidget(add_btn)
+        self.add_btn = QPushButton("Add")
+        self.add_btn.clicked.connect(self.add_entry)
+        style_button(self.add_btn, min_height=28)
+        form.addWidget(self.add_btn)
 
         layout.addLayout(form)
 
@@ -81,25 +109,44 @@ class ScheduleTab(QWidget):
         layout.addWidget(self.table)
 
         actions = QHBoxLayout()
-        delete_btn = QPushButton("Delete Selected")
-        delete_btn.clicked.connect(self.delete_selected)
-        style_button(delete_btn, min_height=28)
-        actions.addWidget(delete_btn)
+        self.delete_btn = QPushButton("Delete Selected")
+        self.delete_btn.clicked.connect(self.delete_selected)
+        style_button(self.delete_btn, min_height=28)
+        actions.addWidget(self.delete_btn)
 
         refresh_btn = QPushButton("Refresh")
-        refresh_btn.clicked.connect(self.refresh_entries)
+        refresh_btn.clicked.connect(self.on_refresh_clicked)
         style_button(refresh_btn, min_height=28)
         actions.addWidget(refresh_btn)
 
         layout.addLayout(actions)
         self.setLayout(layout)
 
+    def showEvent(self, event):
+        super().showEvent(event)
+        if self._dirty:
+            self._dirty = False
+            self.refresh_entries()
+
     def current_user(self):
         return self.app_state.get("user_id")
 
     def api(self):
         return self.app_state.get("api")
 
+    def _schedule_key(self, user_id):
+        return ("list_schedule", user_id)
+
+    def on_refresh_clicked(self):
+        # An explicit refresh always goes to the server
+        cached_call.invalidate(self._schedule_key(self.current_user()))
+        self.refresh_entries()
+
+    def _set_busy(self, busy):
+        """Disable Add/Delete while a schedule change is in flight."""
+        self.add_btn.setEnabled(not busy)
+        self.delete_btn.setEnabled(not busy)
+
     def add_entry(self):
         user_id = self.current_user()
         api = self.api()
@@ -110,14 +157,22 @@ class ScheduleTab(QWidget):
         time_value = self.time_input.text().strip()
         direction = self.direction_box.currentText()
         area = self.area_input.currentText().strip()
-        if not time_value or not area or area == "-- Select Area --":
+        if not time_value or not area or area == AREA_PLACEHOLDER:
             QMessageBox.warning(self, "Missing fields", "Please provide time and area.")
             return
-        try:
-            api.add_schedule(user_id, day, time_value, direction, area)
-        except ApiClientError as exc:
-            QMessageBox.critical(self, "Unable to add", str(exc))
+        if not self.time_input.hasAcceptableInput():
+            QMessageBox.warning(self, "Invalid time", "Please enter the time as HH:MM (e.g. 08:30).")
+            return
+        self._set_busy(True)
+        run_in_background(api.add_schedule, user_id, day, time_value, direction, area,
+                          on_finished=lambda _response, error: self._on_entry_added(user_id, error))
+
+    def _on_entry_added(self, user_id, error):
+        self._set_busy(False)
+        if error is not None:
+            QMessageBox.critical(self, "Unable to add", str(error))
             return
+        cached_call.invalidate(self._schedule_key(user_id))
         self.time_input.clear()
         try:
             self.area_input.setCurrentIndex(0)
@@ -126,6 +181,10 @@ class ScheduleTab(QWidget):
         self.refresh_entries()
 
     def refresh_entries(self):
+        if not self.isVisible():
+            # Defer the fetch and rebuild until the tab is shown again
+            self._dirty = True
+            return
         api = self.api()
         user_id = self.current_user()
         if not api or not user_id:
@@ -137,20 +196,43 @@ class ScheduleTab(QWidget):
             self.entries = []
             self.table.setRowCount(0)
             return
-        try:
-            response = api.list_schedule(user_id)
-        except ApiClientError as exc:
-            self.info_label.setText(f"Unable to load schedule: {exc}")
+        if self._loading:
+            self._stale = True
+            return
+        self._loading = True
+        run_in_background(cached_call, self._schedule_key(user_id), lambda: api.list_schedule(user_id),
+                          on_finished=self._on_entries_loaded)
+
+    def _on_entries_loaded(self, response, error):
+        self._loading = False
+        if self._stale:
+            # Something changed while this fetch was running; drop what it cached and fetch again
+            self._stale = False
+            cached_call.invalidate(self._schedule_key(self.current_user()))
+            self.refresh_entries()
+            return
+        if error is not None:
+            self.info_label.setText(f"Unable to load schedule: {error}")
             return
         self.entries = response.get("payload", {}).get("entries", [])
-        self.table.setRowCount(len(self.entries))
-        for row, entry in enumerate(self.entries):
-            self.table.setItem(row, 0, QTableWidgetItem(entry.get("day", "")))
-            self.table.setItem(row, 1, QTableWidgetItem(entry.get("time", "")))
-            self.table.setItem(row, 2, QTableWidgetItem(entry.get("direction", "")))
-            self.table.setItem(row, 3, QTableWidgetItem(entry.get("area", "")))
-            # store schedule id in first column
-            self.table.item(row, 0).setData(Qt.UserRole, entry.get("id"))
+        table = self.table
+        # Sorting would move rows mid-fill; suspend it and painting for the rebuild
+        sorting = table.isSortingEnabled()
+        table.setSortingEnabled(False)
+        table.setUpdatesEnabled(False)
+        try:
+            table.setRowCount(len(self.entries))
+            for row, entry in enumerate(self.entries):
+                day_item = QTableWidgetItem(entry.get("day", ""))
+                # store schedule id in first column
+                day_item.setData(Qt.UserRole, entry.get("id"))
+                table.setItem(row, 0, day_item)
+                table.setItem(row, 1, QTableWidgetItem(entry.get("time", "")))
+                table.setItem(row, 2, QTableWidgetItem(entry.get("direction", "")))
+                table.setItem(row, 3, QTableWidgetItem(entry.get("area", "")))
+        finally:
+            table.setUpdatesEnabled(True)
+            table.setSortingEnabled(sorting)
 
     def delete_selected(self):
         selected = self.table.currentRow()
@@ -163,9 +245,14 @@ class ScheduleTab(QWidget):
         user_id = self.current_user()
         if not api or not user_id or not schedule_id:
             return
-        try:
-            api.delete_schedule_entry(user_id, schedule_id)
-        except ApiClientError as exc:
-            QMessageBox.critical(self, "Unable to delete", str(exc))
+        self._set_busy(True)
+        run_in_background(api.delete_schedule_entry, user_id, schedule_id,
+                          on_finished=lambda _response, error: self._on_entry_deleted(user_id, error))
+
+    def _on_entry_deleted(self, user_id, error):
+        self._set_busy(False)
+        if error is not None:
+            QMessageBox.critical(self, "Unable to delete", str(error))
             return
+        cached_call.invalidate(self._schedule_key(user_id))
         self.refresh_entries()
@@ -24,6 +24,26 @@ QPushButton:hover {{
 }}
 """
 
+# Page-level rules applied once on the QApplication (see app.build_app) instead of
+# per-page setStyleSheet calls; pages are matched by their objectName.
+GLOBAL_QSS = f"""
+QWidget#LoginPage, QWidget#LoginPage QWidget {{
+  font-family: Verdana;
+}}
+QWidget#LoginPage QPushButton, QWidget#RegisterPage QPushButton {{
+  background-color: white;
+  border-radius: 6px;
+  padding: 8px;
+}}
+QWidget#PreliminaryPage QPushButton {{
+  padding: 8px;
+  border-radius: 6px;
+}}
+QWidget#LoginPage QLabel, QWidget#RegisterPage QLabel, QWidget#PreliminaryPage QLabel {{
+  color: {PRIMARY_COLOR};
+}}
+"""
+
 
 def style_button(btn: QPushButton, min_height: int = 36):
     """Apply a consistent style to buttons."""
@@ -38,12 +58,21 @@ def style_button(btn: QPushButton, min_height: int = 36):
         pass
 
 
+# Title label stylesheet and fonts (by point size). Fonts are created lazily because
+# QFont needs the QApplication to exist; setFont copies, so sharing them is safe.
+TITLE_CSS = f"color: {PRIMARY_COLOR};"
+_title_fonts = {}
+
+
 def set_title_label(lbl: QLabel, size: int = 16):
     """Set font and color for title-like labels."""
-    f = QFont("Verdana", size)
-    f.setBold(True)
+    f = _title_fonts.get(size)
+    if f is None:
+        f = QFont("Verdana", size)
+        f.setBold(True)
+        _title_fonts[size] = f
     lbl.setFont(f)
-    lbl.setStyleSheet(f"color: {PRIMARY_COLOR};")
+    lbl.setStyleSheet(TITLE_CSS)
 
 
 def style_input(widget, min_height: int = 32, width: int = 260, font_size: int = 12, center: bool = True):
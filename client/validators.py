@@ -6,7 +6,8 @@ import re
 
 # Simple, pragmatic email validator. This is not fully RFC-complete but
 # rejects obviously-invalid strings and accepts most normal addresses.
-_EMAIL_RE = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+# Anchored with \A/\Z so a plain match() checks the whole string.
+_EMAIL_RE = re.compile(r"\A[^@\s]+@[^@\s]+\.[^@\s]+\Z")
 
 
 def is_valid_email(email: str) -> bool:
@@ -17,4 +18,16 @@ def is_valid_email(email: str) -> bool:
     """
     if not email or not isinstance(email, str):
         return False
-    return _EMAIL_RE.fullmatch(email.strip()) is not None
+    if email[0].isspace() or email[-1].isspace():
+        email = email.strip()
+    if _quick_reject(email):
+        return False
+    return _EMAIL_RE.match(email) is not None
+
+
+def _quick_reject(email: str) -> bool:
+    """Cheap substring checks that catch most typos before entering the regex engine.
+
+    Only rejects strings the full regex would also reject.
+    """
+    return email.count("@") != 1 or "." not in email.rsplit("@", 1)[1] or " " in email
@@ -0,0 +1,74 @@
+"""Background workers for running blocking API calls off the Qt UI thread.
+
+`run_in_background` schedules a callable on a single-thread `QThreadPool` and
+delivers `(result, error)` back to a callback on the UI thread. The shared
+`ApiClient` handles one request at a time, so calls run one after another,
+in the order they were scheduled.
+"""
+
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal, pyqtSlot  # type: ignore
+
+
+class _WorkerSignals(QObject):
+    finished = pyqtSignal(object, object)
+
+
+class _Relay(QObject):
+    """Lives on the UI thread so `finished` is delivered through a queued connection."""
+
+    def __init__(self, callback):
+        super().__init__()
+        self._callback = callback
+
+    @pyqtSlot(object, object)
+    def deliver(self, result, error):
+        _pending.discard(self)
+        if self._callback:
+            self._callback(result, error)
+
+
+class ApiWorker(QRunnable):
+    """Runs `fn(*args, **kwargs)` on a pool thread and emits `finished(result, error)`."""
+
+    def __init__(self, fn, *args, **kwargs):
+        super().__init__()
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.signals = _WorkerSignals()
+
+    def run(self):
+        try:
+            result = self.fn(*self.args, **self.kwargs)
+        except Exception as exc:
+            self.signals.finished.emit(None, exc)
+            return
+        self.signals.finished.emit(result, None)
+
+
+# Relays (and the signals they hold) must outlive the worker until delivery.
+_pending = set()
+_pool = None
+
+
+def _api_pool():
+    """The serial pool background calls run on; created on first use, after the QApplication."""
+    global _pool
+    if _pool is None:
+        _pool = QThreadPool()
+        _pool.setMaxThreadCount(1)
+    return _pool
+
+
+def run_in_background(fn, *args, on_finished=None, **kwargs):
+    """Run `fn` on the serial API pool; call `on_finished(result, error)` on the UI thread.
+
+    Must be called from the UI thread.
+    """
+    worker = ApiWorker(fn, *args, **kwargs)
+    relay = _Relay(on_finished)
+    relay._signals = worker.signals
+    _pending.add(relay)
+    worker.signals.finished.connect(relay.deliver)
+    _api_pool().start(worker)
+    return worker
@@ -1,7 +1,8 @@
 #!/usr/bin/env python3
 import sqlite3
 import argparse
-from datetime import datetime, timedelta
+import csv
+import sys
 
 DB = 'aubus.db'
 
@@ -14,47 +15,54 @@ parser.add_argument('--radius-mins', type=int, default=30, help='Show schedule t
 args = parser.parse_args()
 
 conn = sqlite3.connect(DB)
+# Connection-local tuning only; journal mode and indexes belong to the server's schema
+conn.execute('PRAGMA temp_store=MEMORY')
+conn.execute('PRAGMA cache_size=-65536')
+conn.execute('PRAGMA mmap_size=268435456')
 c = conn.cursor()
+writer = csv.writer(sys.stdout)
 
 print('*** Users (first 50)')
-for row in c.execute('SELECT id, name, username, is_driver, area FROM users LIMIT 50'):
-    print(row)
+writer.writerows(c.execute('SELECT id, name, username, is_driver, area FROM users LIMIT 50'))
 
 print('\n*** Distinct schedule areas/directions/days (sample)')
-for row in c.execute('SELECT DISTINCT area, direction, day FROM schedules ORDER BY area, direction, day'):
-    print(row)
+writer.writerows(c.execute('SELECT DISTINCT area, direction, day FROM schedules ORDER BY area, direction, day'))
 
 if args.day and args.direction and args.area:
     print(f"\n*** Schedules matching day={args.day}, direction={args.direction}, area={args.area}")
     q = 'SELECT id, user_id, day, time, direction, area FROM schedules WHERE day=? AND direction=? AND area=? ORDER BY time'
-    rows = list(c.execute(q, (args.day, args.direction, args.area)))
+    rows = c.execute(q, (args.day, args.direction, args.area)).fetchall()
     if not rows:
         print('No exact matching schedule rows found for those filters.')
-    for r in rows:
-        print(r)
+    writer.writerows(rows)
 
 # show schedules within +/- radius of given time
 if args.time:
     try:
-        t = datetime.strptime(args.time, '%H:%M')
-    except Exception as e:
+        h, m = map(int, args.time.split(':'))
+        if not (0 <= h < 24 and 0 <= m < 60):
+            raise ValueError(f'{args.time!r} is out of range')
+    except ValueError as e:
         print(f'Failed to parse time: {e}')
         conn.close()
         exit(1)
-    lower = (t - timedelta(minutes=args.radius_mins)).time().strftime('%H:%M')
-    upper = (t + timedelta(minutes=args.radius_mins)).time().strftime('%H:%M')
+    # Work in minutes since midnight, clamped to the queried day
+    total = h * 60 + m
+    lo = max(total - args.radius_mins, 0)
+    hi = min(total + args.radius_mins, 1439)
+    lower = f'{lo // 60:02d}:{lo % 60:02d}'
+    upper = f'{hi // 60:02d}:{hi % 60:02d}'
     print(f"\n*** Schedules within +/-{args.radius_mins} minutes ({lower} - {upper}) on day={args.day} and area={args.area} and direction={args.direction}")
     q2 = '''SELECT id, user_id, day, time, direction, area FROM schedules WHERE day=? AND direction=? AND area=? AND time BETWEEN ? AND ? ORDER BY time'''
-    rows2 = list(c.execute(q2, (args.day, args.direction, args.area, lower, upper)))
+    rows2 = c.execute(q2, (args.day, args.direction, args.area, lower, upper)).fetchall()
     if not rows2:
         print('No schedule rows within time window.')
-    for r in rows2:
-        print(r)
+    writer.writerows(rows2)
 
 # show all schedules for the day (first 200) to inspect formatting
 print('\n*** Sample schedules for day (first 200 rows)')
-for row in c.execute('SELECT id, user_id, day, time, direction, area FROM schedules WHERE day=? ORDER BY time LIMIT 200', (args.day,)):
-    print(row)
+c.arraysize = 200
+writer.writerows(c.execute('SELECT id, user_id, day, time, direction, area FROM schedules WHERE day=? ORDER BY time LIMIT 200', (args.day,)))
 
 conn.close()
 print('\nDone.')
@@ -1,4 +1,5 @@
 import os
+import functools
 import importlib.util
 
 # Load server/database.py as a module (server isn't a package here)
@@ -7,7 +8,8 @@ db_path = os.path.join(base, 'server', 'database.py')
 spec = importlib.util.spec_from_file_location('server_database', db_path)
 db = importlib.util.module_from_spec(spec)
 spec.loader.exec_module(db)
-find_drivers = db.find_drivers
+# Repeated cases reuse the real find_drivers result instead of querying again
+find_drivers = functools.lru_cache(maxsize=32)(db.find_drivers)
 
 cases = [
     ("To University", "Monday", "17:44", "Beirut"),
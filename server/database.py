@@ -1,151 +1,445 @@
 """Database helpers for the AUBus server.
 
 Provides simple SQLite accessors for users, schedules, rides, ratings and
-messages. Includes lightweight migration routines via `_ensure_column`.
+messages. Schema changes are applied once by the versioned `_MIGRATIONS`
+steps, tracked with `PRAGMA user_version`.
 """
 
+import atexit
+import base64
+import binascii
+import functools
+import logging
+import queue
 import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 
 DB_FILE = "aubus.db"
 
-
+log = logging.getLogger(__name__)
+
+DAYS = ("Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday")
+DAY_INDEX = {day: i for i, day in enumerate(DAYS)}
+# Width of the departure window find_drivers matches, in minutes
+MATCH_WINDOW_MIN = 15
+
+# Per-connection tuning, applied to every new connection
+_CONN_PRAGMAS = (
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-64000",
+    "PRAGMA mmap_size=268435456",
+)
+# journal_mode=WAL is stored in the database file, so it only needs setting once per process
+_wal_enabled = False
+# Only takes effect when the database file is created; an existing (WAL) database keeps its page size
+PAGE_SIZE = 8192
+
+
+# DELETE ... RETURNING needs SQLite 3.35+
+_HAS_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+# Idle read connections kept for reuse; extra connections opened under load are closed on release
+POOL_SIZE = 8
+# Per-connection LRU of prepared statements; pooled connections keep it warm across calls
+STATEMENT_CACHE_SIZE = 256
+# Seconds a connection waits on another process's lock (PRAGMA busy_timeout) before raising
+BUSY_TIMEOUT = 5.0
+
+
+def _connect(read_only=False):
+    global _wal_enabled
+    conn = sqlite3.connect(DB_FILE, timeout=BUSY_TIMEOUT, check_same_thread=False,
+                           cached_statements=STATEMENT_CACHE_SIZE)
+    if not _wal_enabled:
+        # Before journal_mode, which writes the header of a new database
+        conn.execute(f"PRAGMA page_size={PAGE_SIZE}")
+        conn.execute("PRAGMA journal_mode=WAL")
+        _wal_enabled = True
+    for pragma in _CONN_PRAGMAS:
+        conn.execute(pragma)
+    if read_only:
+        # Pooled connections are for reads; a stray write fails instead of racing the write connection
+        conn.execute("PRAGMA query_only=1")
+    # Rows support both positional and by-name access, and dict(row) maps columns to values
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+class _Pool:
+    """Bounded set of idle connections handed out to one thread at a time."""
+
+    def __init__(self, size):
+        self._idle = queue.Queue(maxsize=size)
+
+    def acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return _connect(read_only=True)
+
+    def release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+_pool = _Pool(POOL_SIZE)
+# SQLite allows one writer at a time, so all writes share one connection behind a lock
+_write_lock = threading.Lock()
+_write_connection = None
+
+
+@contextmanager
 def get_conn():
-    return sqlite3.connect(DB_FILE, check_same_thread=False)
+    """Borrow a pooled connection for reads; it goes back to the pool afterwards."""
+    conn = _pool.acquire()
+    try:
+        yield conn
+    finally:
+        _pool.release(conn)
+
+
+@contextmanager
+def write_conn():
+    """Hold the write connection; commits on success and rolls back on error."""
+    global _write_connection
+    with _write_lock:
+        if _write_connection is None:
+            _write_connection = _connect()
+        conn = _write_connection
+        try:
+            yield conn
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
+
+
+def retry_on_busy(ms=50, tries=5):
+    """Retry a write that failed with "database is locked", backing off from `ms` milliseconds.
+
+    Each attempt runs in its own write_conn transaction, which is rolled back on the error,
+    so the wrapped function is simply called again.
+    """
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            delay = ms / 1000
+            for attempt in range(tries):
+                try:
+                    return fn(*args, **kwargs)
+                except sqlite3.OperationalError as exc:
+                    if "database is locked" not in str(exc) or attempt == tries - 1:
+                        raise
+                    log.warning("%s: database is locked, retrying in %.0f ms", fn.__name__, delay * 1000)
+                    time.sleep(delay)
+                    delay *= 2
+        return wrapper
+    return decorate
+
+
+def close_connections():
+    """Close the idle pooled connections and the write connection.
+
+    Registered with atexit; closing the last connection also checkpoints the WAL into the database file.
+    """
+    global _write_connection
+    _pool.close()
+    with _write_lock:
+        if _write_connection is not None:
+            _write_connection.close()
+            _write_connection = None
+
+
+atexit.register(close_connections)
+
+
+# Indexes for the columns the lookups below filter, join and sort on
+_INDEXES = (
+    "CREATE INDEX IF NOT EXISTS idx_rides_passenger ON rides(passenger_id, requested_at DESC)",
+    # The driver_id prefix serves every driver lookup; with status it also serves get_pending_rides_for_driver
+    "CREATE INDEX IF NOT EXISTS idx_rides_driver_status ON rides(driver_id, status, requested_at)",
+    "CREATE INDEX IF NOT EXISTS idx_schedules_lookup ON schedules(day, direction, area, time)",
+    "CREATE INDEX IF NOT EXISTS idx_schedules_user ON schedules(user_id)",
+    # Must match find_drivers' normalised direction/area expressions exactly to be used
+    "CREATE INDEX IF NOT EXISTS idx_schedules_match ON schedules("
+    "lower(replace(direction, '_', ' ')), lower(replace(area, '_', ' ')), day_idx, time_min)",
+    "CREATE INDEX IF NOT EXISTS idx_ratings_user_role ON ratings(rated_user_id, role)",
+    "CREATE INDEX IF NOT EXISTS idx_ride_offers_driver ON ride_offers(driver_id, ride_id)",
+    "CREATE INDEX IF NOT EXISTS idx_ride_offers_ride ON ride_offers(ride_id)",
+)
+
 
 def init_db():
-    conn = get_conn()
-    c = conn.cursor()
+    with write_conn() as conn:
+        c = conn.cursor()
+        # Table creation and migrations commit together (or not at all) in one transaction
+        c.execute("BEGIN IMMEDIATE")
 
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            email TEXT NOT NULL,
-            username TEXT UNIQUE NOT NULL,
-            password TEXT NOT NULL,
-            is_driver INTEGER DEFAULT 0,
-            area TEXT,
-            role_selected INTEGER DEFAULT 0
-        )
+        c.execute("""
+            CREATE TABLE IF NOT EXISTS users (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL,
+                email TEXT NOT NULL,
+                username TEXT UNIQUE NOT NULL,
+                password TEXT NOT NULL,
+                is_driver INTEGER DEFAULT 0,
+                area TEXT,
+                role_selected INTEGER DEFAULT 0
+            )
+        """)
+
+        c.execute("""
+            CREATE TABLE IF NOT EXISTS schedules (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                day TEXT NOT NULL,
+                time TEXT NOT NULL,
+                direction TEXT NOT NULL,
+                area TEXT,
+                FOREIGN KEY(user_id) REFERENCES users(id)
+            )
+        """)
+
+        c.execute("""
+            CREATE TABLE IF NOT EXISTS rides (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                passenger_id INTEGER,
+                driver_id INTEGER,
+                day TEXT,
+                time TEXT,
+                area TEXT,
+                status TEXT,
+                requested_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                started_at TEXT,
+                completed_at TEXT,
+                FOREIGN KEY(passenger_id) REFERENCES users(id),
+                FOREIGN KEY(driver_id) REFERENCES users(id)
+            )
+        """)
+
+        c.execute("""
+            CREATE TABLE IF NOT EXISTS ratings (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                rated_user_id INTEGER NOT NULL,
+                rater_user_id INTEGER NOT NULL,
+                rating INTEGER NOT NULL,
+                role TEXT NOT NULL,
+                ride_id INTEGER,
+                FOREIGN KEY(rated_user_id) REFERENCES users(id),
+                FOREIGN KEY(rater_user_id) REFERENCES users(id),
+                FOREIGN KEY(ride_id) REFERENCES rides(id)
+            )
+        """)
+
+        c.execute("""
+            CREATE TABLE IF NOT EXISTS messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                sender_id INTEGER NOT NULL,
+                receiver_id INTEGER NOT NULL,
+                body TEXT NOT NULL,
+                sent_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY(sender_id) REFERENCES users(id),
+                FOREIGN KEY(receiver_id) REFERENCES users(id)
+            )
+        """)
+
+        c.execute("""
+            CREATE TABLE IF NOT EXISTS ride_offers (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                ride_id INTEGER NOT NULL,
+                driver_id INTEGER NOT NULL,
+                FOREIGN KEY(ride_id) REFERENCES rides(id),
+                FOREIGN KEY(driver_id) REFERENCES users(id)
+            )
+        """)
+
+        # Schema changes since the original tables; each runs once, tracked by PRAGMA user_version
+        version = c.execute("PRAGMA user_version").fetchone()[0]
+        for target, migrate in enumerate(_MIGRATIONS[version:], version + 1):
+            migrate(c)
+            c.execute(f"PRAGMA user_version={target}")
+
+
+def _migrate_v1(c):
+    """Columns, backfills and indexes added before migrations were versioned."""
+    _ensure_column(c, "users", "role_selected", "INTEGER DEFAULT 0")
+    _ensure_column(c, "rides", "requested_at", "TEXT DEFAULT CURRENT_TIMESTAMP")
+    _ensure_column(c, "rides", "started_at", "TEXT")
+    _ensure_column(c, "rides", "completed_at", "TEXT")
+    _ensure_column(c, "schedules", "area", "TEXT")
+    _ensure_column(c, "messages", "attachment_filename", "TEXT")
+    _ensure_column(c, "messages", "attachment_mime", "TEXT")
+    _ensure_column(c, "messages", "attachment_data", "TEXT")
+    # Raw attachment bytes; attachment_data only holds base64 text from older rows
+    _ensure_column(c, "messages", "attachment_blob", "BLOB")
+    _ensure_column(c, "users", "min_rating", "INTEGER DEFAULT 0")
+    # Integer copies of schedules.day/time for range matching; backfill rows written before they existed
+    _ensure_column(c, "schedules", "day_idx", "INTEGER")
+    _ensure_column(c, "schedules", "time_min", "INTEGER")
+    c.execute(f"""
+        UPDATE schedules
+        SET day_idx = CASE day {" ".join(f"WHEN '{d}' THEN {i}" for i, d in enumerate(DAYS))} END,
+            time_min = CAST(substr(time, 1, instr(time, ':') - 1) AS INTEGER) * 60
+                       + CAST(substr(time, instr(time, ':') + 1) AS INTEGER)
+        WHERE time_min IS NULL AND instr(time, ':') > 0
     """)
 
+    for index in _INDEXES:
+        c.execute(index)
+
+    # One rating per rater per ride, enforced for upsert_rating's ON CONFLICT
+    if not c.execute("SELECT 1 FROM sqlite_master WHERE type='index' AND name='ux_ratings_ride_rater'").fetchone():
+        # Keep the latest of any duplicates so the unique index can be built
+        c.execute("""
+            DELETE FROM ratings
+            WHERE ride_id IS NOT NULL AND id NOT IN (
+                SELECT MAX(id) FROM ratings WHERE ride_id IS NOT NULL GROUP BY ride_id, rater_user_id
+            )
+        """)
+        c.execute("CREATE UNIQUE INDEX ux_ratings_ride_rater ON ratings(ride_id, rater_user_id)")
+
+
+def _migrate_v2(c):
+    """Materialise each user's driver rating on users, kept current by triggers on ratings."""
+    _ensure_column(c, "users", "avg_rating", "REAL DEFAULT 0")
+    _ensure_column(c, "users", "rating_count", "INTEGER DEFAULT 0")
     c.execute("""
-        CREATE TABLE IF NOT EXISTS schedules (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            day TEXT NOT NULL,
-            time TEXT NOT NULL,
-            direction TEXT NOT NULL,
-            area TEXT,
-            FOREIGN KEY(user_id) REFERENCES users(id)
-        )
+        UPDATE users
+        SET avg_rating = COALESCE((SELECT AVG(rating) FROM ratings WHERE rated_user_id=users.id AND role='driver'), 0),
+            rating_count = (SELECT COUNT(*) FROM ratings WHERE rated_user_id=users.id AND role='driver')
     """)
+    for event, refresh in (("INSERT", ("NEW",)), ("UPDATE", ("OLD", "NEW")), ("DELETE", ("OLD",))):
+        statements = "".join(_REFRESH_DRIVER_RATING.format(row=row) for row in refresh)
+        c.execute(f"CREATE TRIGGER IF NOT EXISTS ratings_{event.lower()}_driver_rating "
+                  f"AFTER {event} ON ratings BEGIN {statements} END")
+
+
+# Recompute one user's driver rating; {row} is OLD or NEW inside a ratings trigger
+_REFRESH_DRIVER_RATING = """
+    UPDATE users
+    SET avg_rating = COALESCE((SELECT AVG(rating) FROM ratings WHERE rated_user_id={row}.rated_user_id AND role='driver'), 0),
+        rating_count = (SELECT COUNT(*) FROM ratings WHERE rated_user_id={row}.rated_user_id AND role='driver')
+    WHERE id={row}.rated_user_id;
+"""
+
 
+def _migrate_v3(c):
+    """Move attachments out of messages into message_attachments, keyed by message id."""
     c.execute("""
-        CREATE TABLE IF NOT EXISTS rides (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            passenger_id INTEGER,
-            driver_id INTEGER,
-            day TEXT,
-            time TEXT,
-            area TEXT,
-            status TEXT,
-            requested_at TEXT DEFAULT CURRENT_TIMESTAMP,
-            started_at TEXT,
-            completed_at TEXT,
-            FOREIGN KEY(passenger_id) REFERENCES users(id),
-            FOREIGN KEY(driver_id) REFERENCES users(id)
+        CREATE TABLE IF NOT EXISTS message_attachments (
+            message_id INTEGER PRIMARY KEY,
+            filename TEXT,
+            mime TEXT,
+            data BLOB NOT NULL,
+            FOREIGN KEY(message_id) REFERENCES messages(id)
         )
     """)
-
     c.execute("""
-        CREATE TABLE IF NOT EXISTS ratings (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            rated_user_id INTEGER NOT NULL,
-            rater_user_id INTEGER NOT NULL,
-            rating INTEGER NOT NULL,
-            role TEXT NOT NULL,
-            ride_id INTEGER,
-            FOREIGN KEY(rated_user_id) REFERENCES users(id),
-            FOREIGN KEY(rater_user_id) REFERENCES users(id),
-            FOREIGN KEY(ride_id) REFERENCES rides(id)
-        )
+        INSERT OR IGNORE INTO message_attachments (message_id, filename, mime, data)
+        SELECT id, attachment_filename, attachment_mime, attachment_blob
+        FROM messages WHERE attachment_blob IS NOT NULL
     """)
-
+    # Rows written before attachment_blob existed hold base64 text
+    legacy = c.execute("""
+        SELECT id, attachment_filename, attachment_mime, attachment_data
+        FROM messages WHERE attachment_blob IS NULL AND attachment_data IS NOT NULL AND attachment_data != ''
+    """).fetchall()
+    for message_id, filename, mime, data in legacy:
+        try:
+            raw = base64.b64decode(data)
+        except (binascii.Error, ValueError):
+            log.warning("skipping undecodable attachment on message %s", message_id)
+            continue
+        c.execute("INSERT OR IGNORE INTO message_attachments (message_id, filename, mime, data) VALUES (?, ?, ?, ?)",
+                  (message_id, filename, mime, raw))
     c.execute("""
-        CREATE TABLE IF NOT EXISTS messages (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            sender_id INTEGER NOT NULL,
-            receiver_id INTEGER NOT NULL,
-            body TEXT NOT NULL,
-            sent_at TEXT DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY(sender_id) REFERENCES users(id),
-            FOREIGN KEY(receiver_id) REFERENCES users(id)
-        )
+        UPDATE messages SET attachment_blob=NULL, attachment_data=NULL
+        WHERE id IN (SELECT message_id FROM message_attachments)
     """)
 
+
+def _migrate_v4(c):
+    """Index messages by unordered conversation pair, for iter_messages."""
     c.execute("""
-        CREATE TABLE IF NOT EXISTS ride_offers (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            ride_id INTEGER NOT NULL,
-            driver_id INTEGER NOT NULL,
-            FOREIGN KEY(ride_id) REFERENCES rides(id),
-            FOREIGN KEY(driver_id) REFERENCES users(id)
-        )
+        CREATE INDEX IF NOT EXISTS idx_msg_conv
+        ON messages(MIN(sender_id, receiver_id), MAX(sender_id, receiver_id), sent_at DESC)
     """)
 
-    _ensure_column(c, "users", "role_selected", "INTEGER DEFAULT 0")
-    _ensure_column(c, "rides", "requested_at", "TEXT DEFAULT CURRENT_TIMESTAMP")
-    _ensure_column(c, "rides", "started_at", "TEXT")
-    _ensure_column(c, "rides", "completed_at", "TEXT")
-    _ensure_column(c, "schedules", "area", "TEXT")
-    _ensure_column(c, "messages", "attachment_filename", "TEXT")
-    _ensure_column(c, "messages", "attachment_mime", "TEXT")
-    _ensure_column(c, "messages", "attachment_data", "TEXT")
-    _ensure_column(c, "users", "min_rating", "INTEGER DEFAULT 0")
 
-    conn.commit()
-    conn.close()
+_MIGRATIONS = (_migrate_v1, _migrate_v2, _migrate_v3, _migrate_v4)
 
 
 def _ensure_column(cursor, table, column, definition):
-    try:
+    columns = {row[1] for row in cursor.execute(f"PRAGMA table_info({table})")}
+    if column not in columns:
         cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
-    except sqlite3.OperationalError as exc:
-        if "duplicate column name" not in str(exc):
-            raise
 
 
 # -----------------------------
 # Users
 # -----------------------------
+_INSERT_SCHEDULE_SQL = """
+    INSERT INTO schedules (user_id, day, time, direction, area, day_idx, time_min)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+
+
+def _time_minutes(time_str):
+    """Minutes since midnight for an "HH:MM" string, or None if it doesn't parse."""
+    try:
+        hours, minutes = map(int, time_str.split(':'))
+    except (AttributeError, ValueError):
+        return None
+    if not (0 <= hours < 24 and 0 <= minutes < 60):
+        return None
+    return hours * 60 + minutes
+
+
+def _schedule_row(user_id, day, time_str, direction, area):
+    return (user_id, day, time_str, direction, area, DAY_INDEX.get(day), _time_minutes(time_str))
+
+
+@retry_on_busy()
 def add_user(name, email, username, password, role, area=None, schedule=None):
     try:
-        conn = get_conn()
-        c = conn.cursor()
-        is_driver = 1 if role == "driver" else 0
-        c.execute("INSERT INTO users (name, email, username, password, is_driver, area, role_selected) VALUES (?, ?, ?, ?, ?, ?, ?)",
-                  (name, email, username, password, is_driver, area, 1))
-        user_id = c.lastrowid
-        if is_driver and schedule:
-            for day, routes in schedule.items():
-                for route, time in routes.items():
-                    add_schedule(user_id, day, time, route, area, conn=conn)
-        conn.commit()
-        conn.close()
+        with write_conn() as conn:
+            is_driver = 1 if role == "driver" else 0
+            user_id = conn.execute("INSERT INTO users (name, email, username, password, is_driver, area, role_selected) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                   (name, email, username, password, is_driver, area, 1)).lastrowid
+            if is_driver and schedule:
+                rows = [_schedule_row(user_id, day, time, route, area)
+                        for day, routes in schedule.items() for route, time in routes.items()]
+                conn.executemany(_INSERT_SCHEDULE_SQL, rows)
+        _user_cache_invalidate(user_id)
         return True
     except sqlite3.IntegrityError:
         return False
 
 
-def authenticate_user(username, password):
-    conn = get_conn()
-    c = conn.cursor()
-    c.execute("SELECT id, name, email, is_driver, area, role_selected FROM users WHERE username=? AND password=?",
-              (username, password))
-    user = c.fetchone()
-    conn.close()
+def get_login(username):
+    """Return (login user dict, stored password hash) for `username`, or None.
+
+    The caller checks the password against the hash before treating the user as signed in.
+    """
+    with get_conn() as conn:
+        user = conn.execute("SELECT id, name, email, is_driver, area, role_selected, password FROM users WHERE username=?",
+                            (username,)).fetchone()
     if user:
         return {
             "user_id": user[0],
@@ -155,328 +449,414 @@ def authenticate_user(username, password):
             "area": user[4],
             "role_selected": bool(user[5]),
             "username": username
-        }
+        }, user[6]
     return None
 
 
+@retry_on_busy()
+def set_password_hash(user_id, password_hash):
+    with write_conn() as conn:
+        conn.execute("UPDATE users SET password=? WHERE id=?", (password_hash, user_id))
+
+
 def get_user_by_username(username):
-    conn = get_conn()
-    c = conn.cursor()
-    c.execute("SELECT id, name, email, username, is_driver, area, min_rating FROM users WHERE username=?", (username,))
-    row = c.fetchone()
-    conn.close()
-    if not row:
-        return None
+    """Return the user dict for `username`, going through get_user_by_id's cache once the id is known."""
+    with _user_cache_lock:
+        user_id = _username_ids.get(username)
+    if user_id is None:
+        # Only the id is read here; the row goes through get_user_by_id so its generation check applies
+        with get_conn() as conn:
+            row = conn.execute("SELECT id FROM users WHERE username=?", (username,)).fetchone()
+        if not row:
+            return None
+        user_id = row[0]
+    return get_user_by_id(user_id)
+
+
+def _user_row_to_dict(row):
+    """Map an (id, name, email, username, is_driver, area, min_rating) row to the user dict."""
     return {"id": row[0], "name": row[1], "email": row[2], "username": row[3], "is_driver": bool(row[4]), "area": row[5], "min_rating": row[6]}
 
 
+# user_id -> (expiry, user dict); recently used entries at the end
+USER_CACHE_SIZE = 1024
+USER_CACHE_TTL = 30.0
+_user_cache = OrderedDict()
+# username -> user_id; usernames never change, so entries only leave with their user's cache entry
+_username_ids = {}
+# user_id -> number of invalidations; a row read before the latest one must not be cached
+_user_generations = {}
+_user_cache_lock = threading.Lock()
+
+
+def _user_cache_invalidate(user_id):
+    with _user_cache_lock:
+        _user_generations[user_id] = _user_generations.get(user_id, 0) + 1
+        hit = _user_cache.pop(user_id, None)
+        if hit is not None:
+            _username_ids.pop(hit[1]["username"], None)
+
+
+def _user_cache_put(user, now, generation):
+    """Cache `user` unless it was invalidated after `generation` was taken (before its row was read)."""
+    with _user_cache_lock:
+        if _user_generations.get(user["id"], 0) != generation:
+            return
+        _user_cache[user["id"]] = (now + USER_CACHE_TTL, user)
+        _user_cache.move_to_end(user["id"])
+        _username_ids[user["username"]] = user["id"]
+        if len(_user_cache) > USER_CACHE_SIZE:
+            _, (_, evicted) = _user_cache.popitem(last=False)
+            _username_ids.pop(evicted["username"], None)
+
+
 def get_user_by_id(user_id):
-    conn = get_conn()
-    c = conn.cursor()
-    c.execute("SELECT id, name, email, username, is_driver, area, min_rating FROM users WHERE id=?", (user_id,))
-    row = c.fetchone()
-    conn.close()
+    """Return the user dict for `user_id`, served from a short-lived LRU cache when possible."""
+    now = time.monotonic()
+    with _user_cache_lock:
+        hit = _user_cache.get(user_id)
+        if hit is not None and hit[0] > now:
+            _user_cache.move_to_end(user_id)
+            return dict(hit[1])
+        generation = _user_generations.get(user_id, 0)
+    user = _get_user_by_id_uncached(user_id)
+    if user is not None:
+        _user_cache_put(user, now, generation)
+        user = dict(user)
+    return user
+
+
+def get_users_bulk(user_ids):
+    """Return {user_id: user dict} for `user_ids`, reading every cache miss in one query."""
+    now = time.monotonic()
+    users = {}
+    missing = {}  # user_id -> its generation before the read
+    with _user_cache_lock:
+        for user_id in dict.fromkeys(user_ids):
+            hit = _user_cache.get(user_id)
+            if hit is not None and hit[0] > now:
+                _user_cache.move_to_end(user_id)
+                users[user_id] = dict(hit[1])
+            else:
+                missing[user_id] = _user_generations.get(user_id, 0)
+    if missing:
+        placeholders = ",".join("?" * len(missing))
+        with get_conn() as conn:
+            rows = conn.execute(f"SELECT id, name, email, username, is_driver, area, min_rating FROM users WHERE id IN ({placeholders})",
+                                list(missing)).fetchall()
+        for row in rows:
+            user = _user_row_to_dict(row)
+            _user_cache_put(user, now, missing[user["id"]])
+            users[user["id"]] = dict(user)
+    return users
+
+
+def _get_user_by_id_uncached(user_id):
+    with get_conn() as conn:
+        row = conn.execute("SELECT id, name, email, username, is_driver, area, min_rating FROM users WHERE id=?", (user_id,)).fetchone()
     if not row:
         return None
-    return {"id": row[0], "name": row[1], "email": row[2], "username": row[3], "is_driver": bool(row[4]), "area": row[5], "min_rating": row[6]}
+    return _user_row_to_dict(row)
 
 
+@retry_on_busy()
 def set_user_role(user_id, role, area, min_rating=None):
-    conn = get_conn()
-    c = conn.cursor()
     is_driver = 1 if role == "driver" else 0
-    if min_rating is None:
-        c.execute("UPDATE users SET is_driver=?, area=?, role_selected=1 WHERE id=?", (is_driver, area, user_id))
-    else:
-        c.execute("UPDATE users SET is_driver=?, area=?, role_selected=1, min_rating=? WHERE id=?", (is_driver, area, int(min_rating), user_id))
-    conn.commit()
-    conn.close()
+    with write_conn() as conn:
+        if min_rating is None:
+            conn.execute("UPDATE users SET is_driver=?, area=?, role_selected=1 WHERE id=?", (is_driver, area, user_id))
+        else:
+            conn.execute("UPDATE users SET is_driver=?, area=?, role_selected=1, min_rating=? WHERE id=?", (is_driver, area, int(min_rating), user_id))
+    _user_cache_invalidate(user_id)
 
 
 # -----------------------------
 # Schedule
 # -----------------------------
-def add_schedule(user_id, day, time, direction, area, conn=None):
-    should_close = False
-    if conn is None:
-        conn = get_conn()
-        should_close = True
-
-    c = conn.cursor()
-    c.execute("INSERT INTO schedules (user_id, day, time, direction, area) VALUES (?, ?, ?, ?, ?)",
-              (user_id, day, time, direction, area))
-    
-    if should_close:
-        conn.commit()
-        conn.close()
+@retry_on_busy()
+def add_schedule(user_id, day, time, direction, area):
+    with write_conn() as conn:
+        conn.execute(_INSERT_SCHEDULE_SQL, _schedule_row(user_id, day, time, direction, area))
 
 
 def get_schedule_entries(user_id):
-    conn = get_conn()
-    c = conn.cursor()
-    c.execute("SELECT id, day, time, direction, area FROM schedules WHERE user_id=? ORDER BY day, time", (user_id,))
-    rows = c.fetchall()
-    conn.close()
-    return [{"id": row[0], "day": row[1], "time": row[2], "direction": row[3], "area": row[4]} for row in rows]
+    with get_conn() as conn:
+        rows = conn.execute("SELECT id, day, time, direction, area FROM schedules WHERE user_id=? ORDER BY day, time", (user_id,)).fetchall()
+    return [dict(row) for row in rows]
 
 
+@retry_on_busy()
 def delete_schedule_entry(schedule_id, user_id):
-    conn = get_conn()
-    c = conn.cursor()
-    c.execute("DELETE FROM schedules WHERE id=? AND user_id=?", (schedule_id, user_id))
-    conn.commit()
-    conn.close()
+    with write_conn() as conn:
+        conn.execute("DELETE FROM schedules WHERE id=? AND user_id=?", (schedule_id, user_id))
 
 
+@retry_on_busy()
 def delete_schedule_for_user(user_id):
-    conn = get_conn()
-    c = conn.cursor()
-    c.execute("DELETE FROM schedules WHERE user_id=?", (user_id,))
-    conn.commit()
-    conn.close()
+    with write_conn() as conn:
+        conn.execute("DELETE FROM schedules WHERE user_id=?", (user_id,))
 
 
 # -----------------------------
 # Rides
 # -----------------------------
+@retry_on_busy()
 def save_ride(passenger_id, driver_id, day, time, area, status="PENDING"):
-    conn = get_conn()
-    c = conn.cursor()
-    c.execute("""
-        INSERT INTO rides (passenger_id, driver_id, day, time, area, status, requested_at)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-    """, (passenger_id, driver_id, day, time, area, status, datetime.utcnow().isoformat()))
-    conn.commit()
-    ride_id = c.lastrowid
-    conn.close()
-    return ride_id
+    with write_conn() as conn:
+        c = conn.execute("""
+            INSERT INTO rides (passenger_id, driver_id, day, time, area, status, requested_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, (passenger_id, driver_id, day, time, area, status, datetime.utcnow().isoformat()))
+    return c.lastrowid
 
 
+@retry_on_busy()
 def create_ride_request(passenger_id, direction, day, time, area, driver_ids):
     # Do not create a ride request if there are no drivers to offer to.
     if not driver_ids:
         return None
 
-    conn = get_conn()
-    c = conn.cursor()
-    c.execute("""
-        INSERT INTO rides (passenger_id, driver_id, day, time, area, status, requested_at)
-        VALUES (?, NULL, ?, ?, ?, 'PENDING', ?)
-    """, (passenger_id, day, time, area, datetime.utcnow().isoformat()))
-    ride_id = c.lastrowid
-    for driver_id in driver_ids:
-        c.execute("INSERT INTO ride_offers (ride_id, driver_id) VALUES (?, ?)", (ride_id, driver_id))
-    conn.commit()
-    conn.close()
+    with write_conn() as conn:
+        ride_id = conn.execute("""
+            INSERT INTO rides (passenger_id, driver_id, day, time, area, status, requested_at)
+            VALUES (?, NULL, ?, ?, ?, 'PENDING', ?)
+        """, (passenger_id, day, time, area, datetime.utcnow().isoformat())).lastrowid
+        conn.executemany("INSERT INTO ride_offers (ride_id, driver_id) VALUES (?, ?)",
+                         ((ride_id, driver_id) for driver_id in driver_ids))
     return ride_id
 
 
+@retry_on_busy()
 def accept_ride_request(ride_id, driver_id):
-    conn = get_conn()
-    c = conn.cursor()
-    c.execute("SELECT driver_id FROM ride_offers WHERE ride_id=?", (ride_id,))
-    other_driver_ids = [row[0] for row in c.fetchall() if row[0] != driver_id]
-    c.execute("UPDATE rides SET driver_id=?, status='ACCEPTED' WHERE id=?", (driver_id, ride_id))
-    c.execute("DELETE FROM ride_offers WHERE ride_id=?", (ride_id,))
-    conn.commit()
-    conn.close()
-    return other_driver_ids
+    """Assign the ride to `driver_id` and clear its offers in one transaction.
+
+    Returns the other offered driver ids, or None if the ride was no longer PENDING.
+    """
+    with write_conn() as conn:
+        updated = conn.execute("UPDATE rides SET driver_id=?, status='ACCEPTED' WHERE id=? AND status='PENDING'",
+                               (driver_id, ride_id)).rowcount
+        if updated == 0:
+            return None
+        if _HAS_RETURNING:
+            offered = conn.execute("DELETE FROM ride_offers WHERE ride_id=? RETURNING driver_id", (ride_id,)).fetchall()
+        else:
+            offered = conn.execute("SELECT driver_id FROM ride_offers WHERE ride_id=?", (ride_id,)).fetchall()
+            conn.execute("DELETE FROM ride_offers WHERE ride_id=?", (ride_id,))
+    return [row[0] for row in offered if row[0] != driver_id]
+
+
+# status -> timestamp column stamped when a ride enters it
+_RIDE_STATE_TIMESTAMPS = {"STARTED": "started_at", "COMPLETED": "completed_at"}
+# status -> statuses a ride may not move to it from (besides the status itself)
+_RIDE_STATE_BLOCKED_FROM = {
+    "STARTED": ("COMPLETED", "CANCELLED"),
+    "COMPLETED": ("CANCELLED",),
+    "CANCELLED": ("COMPLETED",),
+}
+
+
+@retry_on_busy()
+def update_ride_state(ride_id, new_status):
+    """Move a ride to `new_status` in a single UPDATE.
+
+    Repeated or disallowed transitions match no row, so the return value (rows changed)
+    tells the caller whether the transition happened without reading the ride first.
+    """
+    ts_column = _RIDE_STATE_TIMESTAMPS.get(new_status)
+    blocked = (new_status,) + _RIDE_STATE_BLOCKED_FROM.get(new_status, ())
+    assignments = "status=?"
+    params = [new_status]
+    if ts_column:
+        assignments += f", {ts_column}=?"
+        params.append(datetime.utcnow().isoformat())
+    params.append(ride_id)
+    params.extend(blocked)
+    sql = f"UPDATE rides SET {assignments} WHERE id=? AND status NOT IN ({', '.join('?' * len(blocked))})"
+    with write_conn() as conn:
+        return conn.execute(sql, params).rowcount
 
 
 def start_ride(ride_id):
-    conn = get_conn()
-    c = conn.cursor()
-    c.execute("UPDATE rides SET status=?, started_at=? WHERE id=?", ("STARTED", datetime.utcnow().isoformat(), ride_id))
-    conn.commit()
-    conn.close()
+    return update_ride_state(ride_id, "STARTED")
 
 
 def complete_ride(ride_id):
-    conn = get_conn()
-    c = conn.cursor()
-    c.execute("UPDATE rides SET status=?, completed_at=? WHERE id=?", ("COMPLETED", datetime.utcnow().isoformat(), ride_id))
-    conn.commit()
-    conn.close()
+    return update_ride_state(ride_id, "COMPLETED")
 
 
 def update_ride_status(ride_id, status):
-    conn = get_conn()
-    c = conn.cursor()
-    c.execute("UPDATE rides SET status=? WHERE id=?", (status, ride_id))
-    conn.commit()
-    conn.close()
+    return update_ride_state(ride_id, status)
+
+
+# How long after completion a ride's ratings can still be edited
+RATING_WINDOW = timedelta(hours=36)
+
+
+def rating_cutoff():
+    """Rides completed at or after this timestamp can still be rated.
+
+    completed_at is stored as utcnow().isoformat(), which orders correctly as a string,
+    so callers compare against the cutoff instead of parsing each timestamp.
+    """
+    return (datetime.utcnow() - RATING_WINDOW).isoformat()
 
 
 def get_user_rides(user_id):
-    conn = get_conn()
-    c = conn.cursor()
-    # Include a count of ride_offers so we can filter out stray PENDING rides with no offers
-    c.execute("""
-        SELECT r.id, r.passenger_id, p.name, r.driver_id, d.name, r.day, r.time,
-               r.area, r.status, r.completed_at, r.started_at, r.requested_at,
-               (SELECT rating FROM ratings WHERE ride_id=r.id AND rater_user_id=?),
-               (SELECT COUNT(*) FROM ride_offers ro WHERE ro.ride_id=r.id) as offer_count
-        FROM rides r
-        LEFT JOIN users p ON r.passenger_id = p.id
-        LEFT JOIN users d ON r.driver_id = d.id
-        WHERE r.passenger_id=? OR r.driver_id=?
-        ORDER BY COALESCE(r.completed_at, r.started_at, r.requested_at) DESC
-    """, (user_id, user_id, user_id))
-    rows = c.fetchall()
-    conn.close()
-    rides = []
-    for row in rows:
-        ride_id, passenger_id, passenger_name, driver_id, driver_name, day, time, area, status, completed_at, started_at, requested_at, rating, offer_count = row
-        # Skip stray PENDING rides that have no recorded ride_offers (likely created in error)
-        if status == 'PENDING' and driver_id is None and offer_count == 0:
-            continue
-        role = "passenger" if user_id == passenger_id else "driver"
-        partner_name = driver_name if role == "passenger" else passenger_name
-        can_rate = False
-        if completed_at:
-            completed_dt = datetime.fromisoformat(completed_at)
-            can_rate = datetime.utcnow() - completed_dt <= timedelta(hours=36)
-        rides.append({
-            "ride_id": ride_id,
-            "role": role,
-            "partner_name": partner_name,
-            "day": day,
-            "time": time,
-            "area": area,
-            "status": status,
-            "completed_at": completed_at,
-            "started_at": started_at,
-            "requested_at": requested_at,
-            "rating": rating,
-            "can_edit_rating": can_rate
-        })
-    return rides
+    return list(iter_user_rides(user_id))
+
+
+def iter_user_rides(user_id):
+    """Yield the user's ride dicts straight from the cursor, newest first.
+
+    The pooled connection stays borrowed until the generator is exhausted or closed.
+    """
+    with get_conn() as conn:
+        # Stray PENDING rides with no driver and no ride_offers (likely created in error) are left out
+        cur = conn.execute("""
+            SELECT r.id AS ride_id, r.passenger_id, p.name AS passenger_name, d.name AS driver_name,
+                   r.day, r.time, r.area, r.status, r.completed_at, r.started_at, r.requested_at,
+                   rt.rating
+            FROM rides r
+            LEFT JOIN users p ON r.passenger_id = p.id
+            LEFT JOIN users d ON r.driver_id = d.id
+            LEFT JOIN ratings rt ON rt.ride_id = r.id AND rt.rater_user_id = ?
+            LEFT JOIN ride_offers ro ON ro.ride_id = r.id
+            WHERE r.passenger_id=? OR r.driver_id=?
+            GROUP BY r.id
+            HAVING NOT (r.status='PENDING' AND r.driver_id IS NULL AND COUNT(ro.id)=0)
+            ORDER BY COALESCE(r.completed_at, r.started_at, r.requested_at) DESC
+        """, (user_id, user_id, user_id))
+        cutoff = rating_cutoff()
+        for row in cur:
+            role = "passenger" if user_id == row["passenger_id"] else "driver"
+            partner_name = row["driver_name"] if role == "passenger" else row["passenger_name"]
+            completed_at = row["completed_at"]
+            can_rate = bool(completed_at) and completed_at >= cutoff
+            yield {
+                "ride_id": row["ride_id"],
+                "role": role,
+                "partner_name": partner_name,
+                "day": row["day"],
+                "time": row["time"],
+                "area": row["area"],
+                "status": row["status"],
+                "completed_at": completed_at,
+                "started_at": row["started_at"],
+                "requested_at": row["requested_at"],
+                "rating": row["rating"],
+                "can_edit_rating": can_rate
+            }
 
 
 def get_pending_rides_for_driver(driver_id):
-    conn = get_conn()
-    c = conn.cursor()
-    c.execute("""
-        SELECT r.id, r.passenger_id, u.name, u.username, r.day, r.time, r.area, r.status
-        FROM rides r
-        JOIN users u ON r.passenger_id = u.id
-        WHERE r.driver_id=? AND r.status='REQUESTED'
-        ORDER BY r.requested_at DESC
-    """, (driver_id,))
-    pending = [{"ride_id": row[0], "passenger_id": row[1], "passenger_name": row[2],
-                "passenger_username": row[3], "day": row[4], "time": row[5],
-                "area": row[6], "status": row[7]} for row in c.fetchall()]
-    conn.close()
-    return pending
+    with get_conn() as conn:
+        rows = conn.execute("""
+            SELECT r.id AS ride_id, r.passenger_id, u.name AS passenger_name, u.username AS passenger_username,
+                   r.day, r.time, r.area, r.status
+            FROM rides r
+            JOIN users u ON r.passenger_id = u.id
+            WHERE r.driver_id=? AND r.status='REQUESTED'
+            ORDER BY r.requested_at DESC
+        """, (driver_id,)).fetchall()
+    return [dict(row) for row in rows]
 
 
 def get_ride_requests_for_driver(driver_id):
-    conn = get_conn()
-    c = conn.cursor()
-    c.execute("""
-        SELECT r.id, r.passenger_id, p.name, r.area, r.time, r.day
-        FROM ride_offers ro
-        JOIN rides r ON ro.ride_id = r.id
-        JOIN users p ON r.passenger_id = p.id
-        WHERE ro.driver_id=? AND r.status='PENDING'
-    """, (driver_id,))
-    requests = [{"ride_id": row[0], "passenger_id": row[1], "passenger_name": row[2], "direction": row[3], "time": row[4], "day": row[5]} for row in c.fetchall()]
-    conn.close()
-    return requests
+    with get_conn() as conn:
+        rows = conn.execute("""
+            SELECT r.id AS ride_id, r.passenger_id, p.name AS passenger_name, r.area AS direction, r.time, r.day
+            FROM ride_offers ro
+            JOIN rides r ON ro.ride_id = r.id
+            JOIN users p ON r.passenger_id = p.id
+            WHERE ro.driver_id=? AND r.status='PENDING'
+        """, (driver_id,)).fetchall()
+    return [dict(row) for row in rows]
 
 
 def get_ride_by_id(ride_id):
-    conn = get_conn()
-    c = conn.cursor()
-    c.execute("""
-        SELECT id, passenger_id, driver_id, day, time, area, status, requested_at, started_at, completed_at
-        FROM rides WHERE id=?
-    """, (ride_id,))
-    row = c.fetchone()
-    conn.close()
+    with get_conn() as conn:
+        row = conn.execute("""
+            SELECT id, passenger_id, driver_id, day, time, area, status, requested_at, started_at, completed_at
+            FROM rides WHERE id=?
+        """, (ride_id,)).fetchone()
     if not row:
         return None
-    return {
-        "id": row[0],
-        "passenger_id": row[1],
-        "driver_id": row[2],
-        "day": row[3],
-        "time": row[4],
-        "area": row[5],
-        "status": row[6],
-        "requested_at": row[7],
-        "started_at": row[8],
-        "completed_at": row[9]
-    }
+    return dict(row)
+
+
+def get_ride_with_parties(ride_id):
+    """get_ride_by_id plus passenger_username and driver_username (None when unset), in one query."""
+    with get_conn() as conn:
+        row = conn.execute("""
+            SELECT r.id, r.passenger_id, r.driver_id, r.day, r.time, r.area, r.status,
+                   r.requested_at, r.started_at, r.completed_at,
+                   p.username AS passenger_username, d.username AS driver_username
+            FROM rides r
+            LEFT JOIN users p ON p.id = r.passenger_id
+            LEFT JOIN users d ON d.id = r.driver_id
+            WHERE r.id=?
+        """, (ride_id,)).fetchone()
+    if not row:
+        return None
+    return dict(row)
+
+
+# Matching query for find_drivers; kept as a constant so it is parsed once per connection and
+# then served from the statement cache. Direction/area compare lower(replace(...)) to handle
+# underscores and case differences. The second time range covers windows that run past
+# midnight into the next day; it is empty otherwise.
+_FIND_DRIVERS_SQL = """
+    SELECT u.id, u.name, u.username, u.avg_rating, u.area, s.time
+    FROM users u
+    JOIN schedules s ON u.id = s.user_id
+    WHERE u.is_driver=1
+      AND u.avg_rating >= ?
+      AND lower(replace(s.direction, '_', ' '))=?
+      AND lower(replace(s.area, '_', ' '))=?
+      AND (
+        (s.day_idx=? AND s.time_min >= ? AND s.time_min < ?) OR
+        (s.day_idx=? AND s.time_min < ?)
+      )
+    GROUP BY u.id
+"""
 
 
 def find_drivers(direction, day, time_str, passenger_area, min_rating=0):
-    print(f"find_drivers called with: direction={direction}, day={day}, time_str={time_str}, passenger_area={passenger_area}, min_rating={min_rating}")
-    try:
-        time_obj = datetime.strptime(time_str, "%H:%M").time()
-    except Exception as e:
-        print(f"[find_drivers] failed to parse time '{time_str}': {e}")
+    debug = log.isEnabledFor(logging.DEBUG)
+    if debug:
+        log.debug("find_drivers called with: direction=%s, day=%s, time_str=%s, passenger_area=%s, min_rating=%s",
+                  direction, day, time_str, passenger_area, min_rating)
+    start = _time_minutes(time_str)
+    if start is None:
+        log.warning("find_drivers: failed to parse time %r", time_str)
         return []
-    time_plus_15 = (datetime.combine(datetime.today(), time_obj) + timedelta(minutes=15)).time()
+    day_idx = DAY_INDEX.get(day)
+    if day_idx is None:
+        log.warning("find_drivers: unknown day %r", day)
+        return []
+    end = start + MATCH_WINDOW_MIN
 
     # Normalize direction/area for case and underscore differences (e.g. 'to_AUB' vs 'To University')
     norm_direction = (direction or "").lower().replace('_', ' ').strip()
     norm_area = (passenger_area or "").lower().strip()
 
-    conn = get_conn()
-    c = conn.cursor()
-
     drivers = []
-    # Prepare SQL and params so we can log them before execution
-    if time_plus_15 < time_obj:  # Midnight crossover
-        next_day_str = (datetime.strptime(day, "%A") + timedelta(days=1)).strftime("%A")
-        # compare lower(replace(...)) to handle underscores and case differences
-        sql = """
-            SELECT u.id, u.name, u.username,
-                   COALESCE(AVG(r.rating),0) as avg_rating,
-                   u.area, s.time
-            FROM users u
-            LEFT JOIN ratings r ON u.id = r.rated_user_id AND r.role='driver'
-            JOIN schedules s ON u.id = s.user_id
-            WHERE u.is_driver=1
-              AND lower(replace(s.direction, '_', ' '))=?
-              AND lower(replace(s.area, '_', ' '))=?
-              AND (
-                (s.day=? AND s.time >= ?) OR
-                (s.day=? AND s.time < ?)
-              )
-            GROUP BY u.id
-            HAVING avg_rating >= ?
-        """
-        params = (norm_direction, norm_area, day, time_obj.strftime("%H:%M"), next_day_str, time_plus_15.strftime("%H:%M"), min_rating)
-    else:
-        sql = """
-            SELECT u.id, u.name, u.username,
-                   COALESCE(AVG(r.rating),0) as avg_rating,
-                   u.area, s.time
-            FROM users u
-            LEFT JOIN ratings r ON u.id = r.rated_user_id AND r.role='driver'
-            JOIN schedules s ON u.id = s.user_id
-            WHERE u.is_driver=1
-              AND lower(replace(s.direction, '_', ' '))=?
-              AND s.day=? AND s.time >= ? AND s.time < ?
-              AND lower(replace(s.area, '_', ' '))=?
-            GROUP BY u.id
-            HAVING avg_rating >= ?
-        """
-        params = (norm_direction, day, time_obj.strftime("%H:%M"), time_plus_15.strftime("%H:%M"), norm_area, min_rating)
-
-    print(f"[find_drivers] SQL params: {params}")
+    # Prepare params up front so they can be logged; past midnight the window continues
+    # on the next day, otherwise the next-day range is [0, 0)
+    params = (min_rating, norm_direction, norm_area, day_idx, start, min(end, 1440),
+              (day_idx + 1) % 7, max(end - 1440, 0))
+
+    if debug:
+        log.debug("find_drivers SQL params: %s", params)
     try:
-        c.execute(sql, params)
-        drivers = c.fetchall()
-        print(f"[find_drivers] SQL returned {len(drivers)} rows")
-        for row in drivers:
-            print(f"[find_drivers] row: {row}")
-    except Exception as e:
-        print(f"[find_drivers] SQL execution error: {e}")
-    finally:
-        conn.close()
+        with get_conn() as conn:
+            drivers = conn.execute(_FIND_DRIVERS_SQL, params).fetchall()
+        if debug:
+            log.debug("find_drivers SQL returned %d rows", len(drivers))
+            for row in drivers:
+                log.debug("find_drivers row: %s", row)
+    except Exception:
+        log.exception("find_drivers SQL execution error")
 
     return [{"id": d[0], "name": d[1], "username": d[2], "rating": d[3], "area": d[4], "time": d[5]} for d in drivers]
 
@@ -484,106 +864,130 @@ def find_drivers(direction, day, time_str, passenger_area, min_rating=0):
 # -----------------------------
 # Ratings
 # -----------------------------
+@retry_on_busy()
 def upsert_rating(rated_user_id, rater_user_id, rating, role, ride_id):
-    conn = get_conn()
-    c = conn.cursor()
-    existing = c.execute("SELECT id FROM ratings WHERE ride_id=? AND rater_user_id=?", (ride_id, rater_user_id)).fetchone()
-    if existing:
-        c.execute("UPDATE ratings SET rated_user_id=?, rating=?, role=? WHERE id=?",
-                  (rated_user_id, rating, role, existing[0]))
-    else:
-        c.execute("""
+    with write_conn() as conn:
+        conn.execute("""
             INSERT INTO ratings (rated_user_id, rater_user_id, rating, role, ride_id)
             VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(ride_id, rater_user_id)
+            DO UPDATE SET rated_user_id=excluded.rated_user_id, rating=excluded.rating, role=excluded.role
         """, (rated_user_id, rater_user_id, rating, role, ride_id))
-    conn.commit()
-    conn.close()
+    # An update can move a rating between users, and ratings change rarely: drop every cached average
+    with _rating_cache_lock:
+        _rating_cache.clear()
+
+
+# (user_id, role) -> (expiry, average); same lifetime as the user cache
+RATING_CACHE_SIZE = 4096
+_rating_cache = {}
+_rating_cache_lock = threading.Lock()
 
 
 def get_average_rating(user_id, role):
-    conn = get_conn()
-    c = conn.cursor()
-    c.execute("SELECT AVG(rating) FROM ratings WHERE rated_user_id=? AND role=?", (user_id, role))
-    avg = c.fetchone()[0]
-    conn.close()
-    return avg or 0
+    """Average rating `user_id` received in `role`, cached for USER_CACHE_TTL seconds."""
+    key = (user_id, role)
+    now = time.monotonic()
+    with _rating_cache_lock:
+        hit = _rating_cache.get(key)
+    if hit is not None and hit[0] > now:
+        return hit[1]
+    with get_conn() as conn:
+        avg = conn.execute("SELECT AVG(rating) FROM ratings WHERE rated_user_id=? AND role=?", (user_id, role)).fetchone()[0]
+    avg = avg or 0
+    with _rating_cache_lock:
+        if len(_rating_cache) >= RATING_CACHE_SIZE:
+            _rating_cache.clear()
+        _rating_cache[key] = (now + USER_CACHE_TTL, avg)
+    return avg
 
 
 # -----------------------------
 # Messages
 # -----------------------------
+@retry_on_busy()
 def save_message(sender_id, receiver_id, body):
-    conn = get_conn()
-    c = conn.cursor()
-    c.execute("""
-        INSERT INTO messages (sender_id, receiver_id, body, sent_at)
-        VALUES (?, ?, ?, ?)
-    """, (sender_id, receiver_id, body, datetime.utcnow().isoformat()))
-    conn.commit()
-    msg_id = c.lastrowid
-    sent_at = c.execute("SELECT sent_at FROM messages WHERE id=?", (msg_id,)).fetchone()[0]
-    conn.close()
+    sent_at = datetime.utcnow().isoformat()
+    with write_conn() as conn:
+        msg_id = conn.execute("""
+            INSERT INTO messages (sender_id, receiver_id, body, sent_at)
+            VALUES (?, ?, ?, ?)
+        """, (sender_id, receiver_id, body, sent_at)).lastrowid
     return {"id": msg_id, "sent_at": sent_at}
 
 
 def fetch_messages(user_id, partner_id, limit=50):
-    conn = get_conn()
-    c = conn.cursor()
-    c.execute("""
-        SELECT sender_id, receiver_id, body, sent_at, attachment_filename, attachment_mime, attachment_data
-        FROM messages
-        WHERE (sender_id=? AND receiver_id=?) OR (sender_id=? AND receiver_id=?)
-        ORDER BY sent_at DESC
-        LIMIT ?
-    """, (user_id, partner_id, partner_id, user_id, limit))
-    rows = c.fetchall()
-    conn.close()
-    result = []
-    for r in reversed(rows):
-        entry = {"sender_id": r[0], "receiver_id": r[1], "body": r[2], "sent_at": r[3]}
-        # attachment columns may be None
-        if len(r) >= 7:
-            entry["attachment_filename"] = r[4]
-            entry["attachment_mime"] = r[5]
-            entry["attachment_data"] = r[6]
-        result.append(entry)
-    return result
-
-
+    return list(iter_messages(user_id, partner_id, limit))
+
+
+def iter_messages(user_id, partner_id, limit=50):
+    """Yield the newest `limit` messages of a conversation, oldest first.
+
+    Attachments are described by filename, mime and size only (all None without one);
+    read the bytes with `open_attachment(message["id"])`.
+    """
+    # The index expressions have no column affinity, so bind integers, ordered in Python
+    low, high = int(user_id), int(partner_id)
+    with get_conn() as conn:
+        cur = conn.execute("""
+            SELECT m.id, m.sender_id, m.receiver_id, m.body, m.sent_at,
+                   a.filename AS attachment_filename, a.mime AS attachment_mime,
+                   length(a.data) AS attachment_size
+            FROM (
+                SELECT id, sender_id, receiver_id, body, sent_at FROM messages
+                WHERE MIN(sender_id, receiver_id)=? AND MAX(sender_id, receiver_id)=?
+                ORDER BY sent_at DESC
+                LIMIT ?
+            ) m
+            LEFT JOIN message_attachments a ON a.message_id = m.id
+            ORDER BY m.sent_at ASC
+        """, (min(low, high), max(low, high), limit))
+        for row in cur:
+            yield dict(row)
+
+
+@retry_on_busy()
 def save_message_with_attachment(sender_id, receiver_id, body, attachment_filename=None, attachment_mime=None, attachment_data=None):
-    conn = get_conn()
-    c = conn.cursor()
-    c.execute("""
-        INSERT INTO messages (sender_id, receiver_id, body, sent_at, attachment_filename, attachment_mime, attachment_data)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-    """, (sender_id, receiver_id, body, datetime.utcnow().isoformat(), attachment_filename, attachment_mime, attachment_data))
-    conn.commit()
-    msg_id = c.lastrowid
-    sent_at = c.execute("SELECT sent_at FROM messages WHERE id=?", (msg_id,)).fetchone()[0]
-    conn.close()
+    """Store a message whose attachment_data is the raw attachment bytes."""
+    sent_at = datetime.utcnow().isoformat()
+    with write_conn() as conn:
+        msg_id = conn.execute("""
+            INSERT INTO messages (sender_id, receiver_id, body, sent_at)
+            VALUES (?, ?, ?, ?)
+        """, (sender_id, receiver_id, body, sent_at)).lastrowid
+        conn.execute("INSERT INTO message_attachments (message_id, filename, mime, data) VALUES (?, ?, ?, ?)",
+                     (msg_id, attachment_filename, attachment_mime, attachment_data))
     return {"id": msg_id, "sent_at": sent_at}
 
 
-def list_contacts(user_id):
-    conn = get_conn()
-    c = conn.cursor()
-    c.execute("""
-        SELECT DISTINCT CASE WHEN passenger_id=? THEN driver_id ELSE passenger_id END AS partner_id
-        FROM rides
-        WHERE (passenger_id=? OR driver_id=?)
-              AND driver_id IS NOT NULL AND passenger_id IS NOT NULL
-    """, (user_id, user_id, user_id))
-    ride_partners = {row[0] for row in c.fetchall() if row[0]}
+@contextmanager
+def open_attachment(message_id):
+    """Read-only file-like handle on a message's attachment bytes.
 
-    c.execute("""
-        SELECT DISTINCT CASE WHEN sender_id=? THEN receiver_id ELSE sender_id END AS partner_id
-        FROM messages
-        WHERE sender_id=? OR receiver_id=?
-    """, (user_id, user_id, user_id))
-    ride_partners.update(row[0] for row in c.fetchall() if row[0])
-    partners = []
-    for partner_id in ride_partners:
-        user = get_user_by_id(partner_id)
-        if user:
-            partners.append(user)
-    return partners
+    Uses SQLite's incremental BLOB I/O, so callers can read in chunks instead of loading
+    the whole attachment. Raises sqlite3.OperationalError if the message has none.
+    """
+    with get_conn() as conn:
+        with conn.blobopen("message_attachments", "data", message_id, readonly=True) as blob:
+            yield blob
+
+
+def list_contacts(user_id):
+    # Ride partners and message partners in one pass, joined to users once
+    with get_conn() as conn:
+        rows = conn.execute("""
+            WITH partners AS (
+                SELECT CASE WHEN passenger_id=:u THEN driver_id ELSE passenger_id END AS pid
+                FROM rides
+                WHERE (passenger_id=:u OR driver_id=:u)
+                      AND driver_id IS NOT NULL AND passenger_id IS NOT NULL
+                UNION
+                SELECT CASE WHEN sender_id=:u THEN receiver_id ELSE sender_id END
+                FROM messages
+                WHERE sender_id=:u OR receiver_id=:u
+            )
+            SELECT u.id, u.name, u.email, u.username, u.is_driver, u.area, u.min_rating
+            FROM users u
+            JOIN partners p ON u.id = p.pid
+        """, {"u": user_id}).fetchall()
+    return [_user_row_to_dict(row) for row in rows]
@@ -1,62 +1,186 @@
 """Simple newline-terminated JSON send/receive helpers for server/client.
 
-`send_json` appends a newline to each message. `recv_json` reads until the
-first newline to support longer JSON payloads (e.g., base64 attachments).
+`send_json` appends a newline to each message. `recv_json` reads one line at a
+time from a buffered reader (`open_reader`), so longer JSON payloads (e.g.
+base64 attachments) and back-to-back messages are framed correctly.
+`JsonFramer` does the same framing for callers that receive bytes themselves,
+such as the server's selector loop.
+
+A message may carry one binary attachment out of band: its payload has
+"attach_len": N and the N raw bytes follow the newline. Receivers hand it back
+as payload["attachment_bytes"], so attachments skip base64 and JSON parsing.
 """
 
 import json
 
+try:
+    import orjson
+except ImportError:  # optional speed-up; the stdlib encoder produces the same wire format
+    orjson = None
+
+if orjson is not None:
+    def _dumps(data):
+        return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS)
+
+    _loads = orjson.loads
+else:
+    def _dumps(data):
+        return json.dumps(data).encode()
+
+    _loads = json.loads
+
+
 # -----------------------------
 # Send JSON over TCP
 # -----------------------------
-def send_json(conn, data):
+def send_json(conn, data, attachment=None):
     """
     Send a Python dictionary as a JSON string over the socket.
     Appends a newline for readability (optional).
+    `attachment` (bytes) is sent raw after the newline, announced by payload["attach_len"].
     """
-    msg = json.dumps(data) + "\n"
-    conn.sendall(msg.encode())
+    parts = [b"\n"]
+    if attachment is not None:
+        data = dict(data, payload=dict(data.get("payload", {}), attach_len=len(attachment)))
+        parts.append(memoryview(attachment))
+    payload = _dumps(data)
+    if hasattr(conn, "sendmsg"):
+        # Gather the payload, newline and attachment in one call instead of copying them into a new buffer
+        _sendmsg_all(conn, [memoryview(payload)] + parts)
+    else:
+        # One sendall rather than several, so the tail isn't held back by Nagle's algorithm
+        conn.sendall(b"".join([payload] + parts))
+
+
+def encode_message(data):
+    """Encode a message as the exact bytes send_json would write, for replies worth encoding once."""
+    return _dumps(data) + b"\n"
+
+
+def _sendmsg_all(conn, parts):
+    """sendmsg() until every buffer in `parts` is written; it may send only part of them."""
+    while parts:
+        sent = conn.sendmsg(parts)
+        while parts and sent >= len(parts[0]):
+            sent -= len(parts[0])
+            parts.pop(0)
+        if sent:
+            parts[0] = parts[0][sent:]
 
 
 # -----------------------------
 # Receive JSON over TCP
 # -----------------------------
-def recv_json(conn):
+MAX_MESSAGE_BYTES = 10 * 1024 * 1024  # 10 MB safety limit
+READ_BUFFER_SIZE = 64 * 1024
+
+
+def open_reader(conn):
+    """
+    Wrap a socket in the buffered reader `recv_json` reads from.
+    Use one reader per connection for its whole life: bytes received past a
+    newline stay buffered for the next message. Close it along with the socket.
+    """
+    return conn.makefile("rb", buffering=READ_BUFFER_SIZE)
+
+
+def recv_json(reader):
     """
-    Receive a JSON message from the socket.
-    Assumes the message fits within 4096 bytes.
+    Receive one newline-terminated JSON message from a reader made by `open_reader`.
+    Returns None when the connection is closed, or the message is too large or not valid JSON.
     """
     try:
-        # Read until newline is found to support larger messages (e.g. base64 attachments).
-        buf = b""
-        max_bytes = 10 * 1024 * 1024  # 10 MB safety limit
-        while True:
-            chunk = conn.recv(4096)
-            if not chunk:
-                # connection closed
-                if not buf:
-                    return None
-                break
-            buf += chunk
-            if b"\n" in buf:
-                # take data up to the first newline
-                idx = buf.find(b"\n")
-                msg_bytes = buf[:idx]
-                try:
-                    msg = msg_bytes.decode().strip()
-                    return json.loads(msg)
-                except json.JSONDecodeError as e:
-                    print("JSON decode error:", e)
-                    return None
-            if len(buf) > max_bytes:
-                print("recv_json: message too large")
-                return None
-        # If we exited the loop without a newline, attempt to decode whatever we have
-        try:
-            msg = buf.decode().strip()
-            return json.loads(msg)
-        except json.JSONDecodeError as e:
-            print("JSON decode error:", e)
-            return None
+        # readline scans the buffer for the newline in C and keeps any following bytes buffered
+        line = reader.readline(MAX_MESSAGE_BYTES + 1)
     except ConnectionResetError:
         return None
+    if not line:
+        # connection closed
+        return None
+    msg = decode_json(line)
+    length = _attachment_length(msg)
+    if length is None:
+        return msg
+    if length < 0:
+        return None
+    data = reader.read(length)
+    if len(data) < length:
+        # connection closed mid-attachment
+        return None
+    msg["payload"]["attachment_bytes"] = data
+    return msg
+
+
+def _attachment_length(msg):
+    """The attach_len a decoded message announces: None without one, -1 if it is unusable."""
+    payload = msg.get("payload") if isinstance(msg, dict) else None
+    if not isinstance(payload, dict) or "attach_len" not in payload:
+        return None
+    length = payload.pop("attach_len")
+    if not isinstance(length, int) or not 0 <= length <= MAX_MESSAGE_BYTES:
+        print("recv_json: bad attachment length", length)
+        return -1
+    return length
+
+
+def decode_json(line):
+    """
+    Decode one received message line (newline optional).
+    Returns None if it is too large or not valid JSON.
+    """
+    if len(line) > MAX_MESSAGE_BYTES:
+        print("recv_json: message too large")
+        return None
+    try:
+        return _loads(line)
+    except (json.JSONDecodeError, UnicodeDecodeError) as e:
+        print("JSON decode error:", e)
+        return None
+
+
+class JsonFramer:
+    """
+    Incremental newline framing: `feed` the bytes of each recv() and get back the
+    messages they complete. A None in the result means the connection should be
+    dropped, as with recv_json; nothing after it is returned.
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+        # Message whose attachment bytes are still arriving, and how many it needs
+        self._waiting = None
+        self._waiting_len = 0
+
+    def feed(self, data):
+        self._buffer += data
+        messages = []
+        start = 0
+        while True:
+            if self._waiting is not None:
+                if len(self._buffer) - start < self._waiting_len:
+                    break
+                end = start + self._waiting_len
+                self._waiting["payload"]["attachment_bytes"] = bytes(self._buffer[start:end])
+                messages.append(self._waiting)
+                self._waiting = None
+                start = end
+                continue
+            end = self._buffer.find(b"\n", start)
+            if end < 0:
+                break
+            msg = decode_json(self._buffer[start:end])
+            start = end + 1
+            length = _attachment_length(msg)
+            if length is not None and length >= 0:
+                self._waiting, self._waiting_len = msg, length
+                continue
+            if length is not None:
+                msg = None
+            messages.append(msg)
+            if msg is None:
+                return messages
+        del self._buffer[:start]
+        if self._waiting is None and len(self._buffer) > MAX_MESSAGE_BYTES:
+            print("recv_json: message too large")
+            messages.append(None)
+        return messages
@@ -4,17 +4,26 @@ Listens for JSON-over-TCP messages from clients, coordinates ride matching,
 P2P peer announcements, and relays chat messages when needed.
 """
 
+import base64
+import binascii
+import selectors
 import socket
 import threading
+import time
+import traceback
 import hashlib
+import hmac
+import os
 import argparse
 import sys
-from datetime import datetime, timedelta
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 from database import (
     init_db,
     add_user,
-    authenticate_user,
+    get_login,
+    set_password_hash,
     set_user_role,
     add_schedule,
     get_schedule_entries,
@@ -31,42 +40,135 @@ from database import (
     upsert_rating,
     get_user_by_username,
     get_user_by_id,
+    get_users_bulk,
     get_pending_rides_for_driver,
     save_message,
     save_message_with_attachment,
+    open_attachment,
     fetch_messages,
     list_contacts,
     get_ride_by_id,
+    get_ride_with_parties,
     update_ride_status,
     get_average_rating,
+    rating_cutoff,
 )
-from protocol import recv_json, send_json
+from protocol import READ_BUFFER_SIZE, JsonFramer, encode_message
+from protocol import send_json as _send_json
 
 HOST = '0.0.0.0'
 PORT = 5555
 clients = {}      # username -> {"conn": socket, "addr": addr, "user_id": int, "peer": {"ip": str, "port": int}}
-db_lock = threading.Lock()
-RATING_WINDOW = timedelta(hours=36)
+# socket -> lock held for each whole message written to it; handler threads share client sockets
+send_locks = {}
+# scrypt cost parameters for password hashes (16 MB of memory per hash)
+SCRYPT_N, SCRYPT_R, SCRYPT_P = 2 ** 14, 8, 1
+# username -> (stored hash, login token, expiry) for quick reconnects, oldest first
+verified_logins = {}
+verified_logins_lock = threading.Lock()
+VERIFIED_LOGINS_MAX = 256
+VERIFIED_LOGIN_TTL = 30  # seconds a verified password may skip scrypt
+# scrypt runs here, releasing the GIL; at most one hash per core is in flight at once
+HASH_POOL = ThreadPoolExecutor(max_workers=os.cpu_count() or 1, thread_name_prefix="hash")
+# Handlers run here; one selector thread does all the reading, so idle connections cost no thread
+HANDLER_POOL = ThreadPoolExecutor(max_workers=32, thread_name_prefix="handler")
 
 
 # -----------------------------
 # Utility helpers
 # -----------------------------
-def hash_password(password):
-    return hashlib.sha256(password.encode()).hexdigest()
+def hash_password(password, salt=None):
+    """Salted scrypt hash, stored as 'scrypt$<salt hex>$<hash hex>'."""
+    if salt is None:
+        salt = os.urandom(16)
+    digest = hashlib.scrypt(password.encode(), salt=salt, n=SCRYPT_N, r=SCRYPT_R, p=SCRYPT_P, dklen=32)
+    return f"scrypt${salt.hex()}${digest.hex()}"
 
 
-def send_to_username(username, data):
+def verify_password(password, stored):
+    """Check `password` against a stored hash in constant time.
+
+    Accounts registered before salting store an unsalted SHA-256 hex digest; those still verify.
+    """
+    if stored.startswith("scrypt$"):
+        salt_hex = stored.split("$")[1]
+        return hmac.compare_digest(hash_password(password, bytes.fromhex(salt_hex)), stored)
+    return hmac.compare_digest(hashlib.sha256(password.encode()).hexdigest(), stored)
+
+
+def _login_token(password, stored):
+    # Cheap keyed digest of a password already verified against `stored`
+    return hashlib.blake2b(password.encode(), key=stored.encode()[:64]).digest()
+
+
+def check_login_password(username, password, stored):
+    """verify_password, skipping scrypt for a password verified for `username` in the last VERIFIED_LOGIN_TTL seconds."""
+    now = time.monotonic()
+    with verified_logins_lock:
+        cached = verified_logins.get(username)
+        if cached is not None and cached[2] <= now:
+            del verified_logins[username]
+            cached = None
+    if cached is not None and cached[0] == stored and hmac.compare_digest(cached[1], _login_token(password, stored)):
+        return True
+    if not verify_password(password, stored):
+        return False
+    token = _login_token(password, stored)
+    with verified_logins_lock:
+        # Re-insert so the dict stays ordered by expiry, then evict expired entries and any overflow from the front
+        verified_logins.pop(username, None)
+        verified_logins[username] = (stored, token, time.monotonic() + VERIFIED_LOGIN_TTL)
+        while verified_logins:
+            oldest = next(iter(verified_logins))
+            if len(verified_logins) <= VERIFIED_LOGINS_MAX and verified_logins[oldest][2] > now:
+                break
+            del verified_logins[oldest]
+    return True
+
+
+# Payload-free replies never change, so their bytes are encoded once
+STATIC_REPLIES = {t: encode_message({"type": t}) for t in (
+    "REGISTER_OK",
+    "LOGIN_FAIL",
+    "ANNOUNCE_OK",
+    "SET_ROLE_OK",
+    "ADD_SCHEDULE_OK",
+    "DELETE_SCHEDULE_OK",
+    "NO_DRIVERS_FOUND",
+    "UPDATE_RATING_OK",
+    "START_RIDE_OK",
+    "COMPLETE_RIDE_OK",
+    "CANCEL_RIDE_OK",
+)}
+
+
+def _send_lock(conn):
+    # A connection that is already closing has no lock left; the send will fail on its own
+    return send_locks.get(conn) or threading.Lock()
+
+
+def send_json(conn, data, attachment=None):
+    """protocol.send_json under the connection's send lock, so concurrent messages don't interleave."""
+    with _send_lock(conn):
+        _send_json(conn, data, attachment=attachment)
+
+
+def send_static(conn, msg_type):
+    """Send one of the STATIC_REPLIES."""
+    with _send_lock(conn):
+        conn.sendall(STATIC_REPLIES[msg_type])
+
+
+def send_to_username(username, data, attachment=None):
     client = clients.get(username)
     if client:
-        send_json(client["conn"], data)
+        send_json(client["conn"], data, attachment=attachment)
 
 
 def can_edit_rating(ride):
     if not ride or not ride.get("completed_at"):
         return False
-    completed = datetime.fromisoformat(ride["completed_at"])
-    return datetime.utcnow() - completed <= RATING_WINDOW
+    return ride["completed_at"] >= rating_cutoff()
 
 
 # -----------------------------
@@ -76,28 +178,33 @@ def handle_register(conn, p):
     name = p["name"]
     email = p["email"]
     username = p["username"]
-    password = hash_password(p["password"])
+    password = HASH_POOL.submit(hash_password, p["password"]).result()
     role = p["role"]
     area = p.get("area")
     schedule = p.get("schedule")
-    with db_lock:
-        success = add_user(name, email, username, password, role, area, schedule)
+    success = add_user(name, email, username, password, role, area, schedule)
     if success:
-        send_json(conn, {"type": "REGISTER_OK"})
+        send_static(conn, "REGISTER_OK")
     else:
         send_json(conn, {"type": "REGISTER_FAIL", "payload": {"reason": "Username taken"}})
 
 
 def handle_login(conn, p):
     username = p["username"]
-    password = hash_password(p["password"])
-    with db_lock:
-        user = authenticate_user(username, password)
+    password = p["password"]
+    login = get_login(username)
+    user = None
+    # Hashing runs outside any DB call so a slow scrypt holds no connection or lock
+    if login and HASH_POOL.submit(check_login_password, username, password, login[1]).result():
+        user = login[0]
+        if not login[1].startswith("scrypt$"):
+            # Upgrade a legacy unsalted hash now that we have the password
+            set_password_hash(user["user_id"], HASH_POOL.submit(hash_password, password).result())
     if user:
         send_json(conn, {"type": "LOGIN_OK", "payload": user})
         return username, user["user_id"]
     else:
-        send_json(conn, {"type": "LOGIN_FAIL"})
+        send_static(conn, "LOGIN_FAIL")
         return None, None
 
 
@@ -118,7 +225,7 @@ def handle_announce_peer(conn, p, username, addr):
         print(f"[Server] ANNOUNCE_PEER from {username} at {addr[0]}:{port}")
     except Exception:
         pass
-    send_json(conn, {"type": "ANNOUNCE_OK"})
+    send_static(conn, "ANNOUNCE_OK")
 
 
 def handle_set_role(conn, p):
@@ -126,33 +233,29 @@ def handle_set_role(conn, p):
     role = p["role"]
     area = p.get("area")
     min_rating = p.get("min_rating")
-    with db_lock:
-        current = get_user_by_id(user_id)
-        # Prevent downgrading an existing driver to passenger
-        if current and current.get("is_driver") and role != "driver":
-            send_json(conn, {"type": "SET_ROLE_FAIL", "payload": {"reason": "Cannot change from driver to passenger"}})
-            return
-        # Allow upgrades (passenger -> driver) and updates to role/area
-        set_user_role(user_id, role, area, min_rating=min_rating)
-    send_json(conn, {"type": "SET_ROLE_OK"})
+    current = get_user_by_id(user_id)
+    # Prevent downgrading an existing driver to passenger
+    if current and current.get("is_driver") and role != "driver":
+        send_json(conn, {"type": "SET_ROLE_FAIL", "payload": {"reason": "Cannot change from driver to passenger"}})
+        return
+    # Allow upgrades (passenger -> driver) and updates to role/area
+    set_user_role(user_id, role, area, min_rating=min_rating)
+    send_static(conn, "SET_ROLE_OK")
 
 
 def handle_add_schedule(conn, p):
-    with db_lock:
-        add_schedule(p["user_id"], p["day"], p["time"], p["direction"], p.get("area"))
-    send_json(conn, {"type": "ADD_SCHEDULE_OK"})
+    add_schedule(p["user_id"], p["day"], p["time"], p["direction"], p.get("area"))
+    send_static(conn, "ADD_SCHEDULE_OK")
 
 
 def handle_list_schedule(conn, p):
-    with db_lock:
-        entries = get_schedule_entries(p["user_id"])
+    entries = get_schedule_entries(p["user_id"])
     send_json(conn, {"type": "SCHEDULE_LIST", "payload": {"entries": entries}})
 
 
 def handle_delete_schedule(conn, p):
-    with db_lock:
-        delete_schedule_entry(p["schedule_id"], p["user_id"])
-    send_json(conn, {"type": "DELETE_SCHEDULE_OK"})
+    delete_schedule_entry(p["schedule_id"], p["user_id"])
+    send_static(conn, "DELETE_SCHEDULE_OK")
 
 
 def handle_broadcast_ride_request(conn, p):
@@ -161,64 +264,62 @@ def handle_broadcast_ride_request(conn, p):
     day = p["day"]
     time = p["time"]
     area = p["area"] # Extract area from payload
-    with db_lock:
-        # Enforce passenger's minimum-driver-rating preference and drivers' minimum-passenger-rating preference.
-        passenger = get_user_by_id(passenger_id)
-        passenger_min = passenger.get("min_rating", 0) if passenger else 0
-        passenger_avg = get_average_rating(passenger_id, 'passenger') if passenger else 0
-
-        # Find drivers whose average driver rating >= passenger's preferred minimum
-        drivers = find_drivers(direction, day, time, area, min_rating=passenger_min)
-        if not drivers:
-            send_json(conn, {"type": "NO_DRIVERS_FOUND"})
-            return
+    # Enforce passenger's minimum-driver-rating preference and drivers' minimum-passenger-rating preference.
+    passenger = get_user_by_id(passenger_id)
+    passenger_min = passenger.get("min_rating", 0) if passenger else 0
+    passenger_avg = get_average_rating(passenger_id, 'passenger') if passenger else 0
+
+    # Find drivers whose average driver rating >= passenger's preferred minimum
+    drivers = find_drivers(direction, day, time, area, min_rating=passenger_min)
+    if not drivers:
+        send_static(conn, "NO_DRIVERS_FOUND")
+        return
 
-        # Filter out drivers who have set a min_rating higher than the passenger's average rating
-        eligible_drivers = []
-        for d in drivers:
-            drv_user = get_user_by_id(d["id"])
-            drv_min = drv_user.get("min_rating", 0) if drv_user else 0
-            if passenger_avg >= drv_min:
-                eligible_drivers.append(d)
-
-        if not eligible_drivers:
-            # No drivers meet both sides' minimum-rating constraints
-            send_json(conn, {"type": "NO_DRIVERS_FOUND"})
-            return
+    # Filter out drivers who have set a min_rating higher than the passenger's average rating
+    eligible_drivers = []
+    driver_users = get_users_bulk([d["id"] for d in drivers])
+    for d in drivers:
+        drv_user = driver_users.get(d["id"])
+        drv_min = drv_user.get("min_rating", 0) if drv_user else 0
+        if passenger_avg >= drv_min:
+            eligible_drivers.append(d)
+
+    if not eligible_drivers:
+        # No drivers meet both sides' minimum-rating constraints
+        send_static(conn, "NO_DRIVERS_FOUND")
+        return
 
-        driver_ids = [driver["id"] for driver in eligible_drivers]
-        ride_id = create_ride_request(passenger_id, direction, day, time, area, driver_ids)
-
-        for driver in eligible_drivers:
-            send_to_username(driver["username"], {
-                "type": "RIDE_REQUEST",
-                "payload": {
-                    "ride_id": ride_id,
-                    "passenger_id": passenger_id,
-                    "passenger_name": passenger["name"] if passenger else "Unknown",
-                    "direction": direction,
-                    "time": time,
-                }
-            })
+    driver_ids = [driver["id"] for driver in eligible_drivers]
+    ride_id = create_ride_request(passenger_id, direction, day, time, area, driver_ids)
+
+    for driver in eligible_drivers:
+        send_to_username(driver["username"], {
+            "type": "RIDE_REQUEST",
+            "payload": {
+                "ride_id": ride_id,
+                "passenger_id": passenger_id,
+                "passenger_name": passenger["name"] if passenger else "Unknown",
+                "direction": direction,
+                "time": time,
+            }
+        })
     send_json(conn, {"type": "BROADCAST_OK", "payload": {"ride_id": ride_id}})
 
 
 def handle_fetch_pending(conn, p):
     driver_id = p["driver_id"]
-    with db_lock:
-        pending = get_pending_rides_for_driver(driver_id)
+    pending = get_pending_rides_for_driver(driver_id)
     send_json(conn, {"type": "PENDING_RIDES", "payload": {"rides": pending}})
 
 
 def handle_fetch_ride_requests(conn, p):
     driver_id = p["driver_id"]
-    with db_lock:
-        requests = get_ride_requests_for_driver(driver_id)
+    requests = get_ride_requests_for_driver(driver_id)
     send_json(conn, {"type": "RIDE_REQUEST_LIST", "payload": {"requests": requests}})
 
 
-def handle_driver_response(conn, p):
-    # validate payload fields and try to infer missing driver_id from the connection
+def handle_driver_response(conn, p, user_id=None):
+    # validate payload fields; a missing driver_id defaults to the user logged in on this connection
     ride_id = p.get("ride_id")
     status = p.get("status")
     driver_id = p.get("driver_id")
@@ -227,61 +328,56 @@ def handle_driver_response(conn, p):
         send_json(conn, {"type": "DRIVER_RESPONSE_OK", "payload": {"status": "ERROR", "reason": "missing ride_id or status"}})
         return
 
-    # If driver_id not provided by client, try to infer it from the connection's registered username
+    # If driver_id not provided by client, infer it from the connection's login
     if driver_id is None:
-        inferred = None
-        for uname, info in clients.items():
-            if info.get("conn") is conn:
-                inferred = info.get("user_id")
-                break
-        if inferred is not None:
-            driver_id = inferred
-        else:
+        driver_id = user_id
+        if driver_id is None:
             send_json(conn, {"type": "DRIVER_RESPONSE_OK", "payload": {"status": "ERROR", "reason": "driver_id missing and could not be inferred"}})
             return
-    with db_lock:
-        ride = get_ride_by_id(ride_id)
-        if not ride or ride["status"] != "PENDING":
-            # Ride already taken or cancelled
+    ride = get_ride_by_id(ride_id)
+    if not ride or ride["status"] != "PENDING":
+        # Ride already taken or cancelled
+        send_json(conn, {"type": "DRIVER_RESPONSE_OK", "payload": {"status": "CLOSED"}})
+        return
+
+    if status == "ACCEPTED":
+        other_driver_ids = accept_ride_request(ride_id, driver_id)
+        if other_driver_ids is None:
             send_json(conn, {"type": "DRIVER_RESPONSE_OK", "payload": {"status": "CLOSED"}})
             return
-
-        if status == "ACCEPTED":
-            other_driver_ids = accept_ride_request(ride_id, driver_id)
-            passenger = get_user_by_id(ride["passenger_id"])
-            # Include driver's peer IP/port in the notification when available
-            driver_user = get_user_by_id(driver_id)
-            peer_info = None
-            if driver_user:
-                info = clients.get(driver_user.get('username'), {})
-                peer_info = info.get('peer') if info else None
-            payload = {"ride_id": ride_id, "status": "ACCEPTED"}
-            if peer_info:
-                payload["driver_ip"] = peer_info.get("ip")
-                payload["driver_port"] = peer_info.get("port")
-            if driver_user:
-                payload["driver_username"] = driver_user.get("username")
-            if passenger:
-                send_to_username(passenger["username"], {"type": "DRIVER_RESPONSE", "payload": payload})
-
-            for other_driver_id in other_driver_ids:
-                other_driver = get_user_by_id(other_driver_id)
-                if other_driver:
-                    send_to_username(other_driver["username"], {"type": "RIDE_UNAVAILABLE", "payload": {"ride_id": ride_id}})
-            send_json(conn, {"type": "DRIVER_RESPONSE_OK", "payload": {"status": "ACCEPTED"}})
-        else: # DENIED
-            # We just notify the passenger that one of the drivers denied.
-            # The request is still open to other drivers.
-            passenger = get_user_by_id(ride["passenger_id"])
-            if passenger:
-                send_to_username(passenger["username"], {"type": "DRIVER_RESPONSE", "payload": {"ride_id": ride_id, "status": "DENIED"}})
-            send_json(conn, {"type": "DRIVER_RESPONSE_OK", "payload": {"status": "DENIED"}})
+        passenger = get_user_by_id(ride["passenger_id"])
+        # Include driver's peer IP/port in the notification when available
+        driver_user = get_user_by_id(driver_id)
+        peer_info = None
+        if driver_user:
+            info = clients.get(driver_user.get('username'), {})
+            peer_info = info.get('peer') if info else None
+        payload = {"ride_id": ride_id, "status": "ACCEPTED"}
+        if peer_info:
+            payload["driver_ip"] = peer_info.get("ip")
+            payload["driver_port"] = peer_info.get("port")
+        if driver_user:
+            payload["driver_username"] = driver_user.get("username")
+        if passenger:
+            send_to_username(passenger["username"], {"type": "DRIVER_RESPONSE", "payload": payload})
+
+        for other_driver_id in other_driver_ids:
+            other_driver = get_user_by_id(other_driver_id)
+            if other_driver:
+                send_to_username(other_driver["username"], {"type": "RIDE_UNAVAILABLE", "payload": {"ride_id": ride_id}})
+        send_json(conn, {"type": "DRIVER_RESPONSE_OK", "payload": {"status": "ACCEPTED"}})
+    else: # DENIED
+        # We just notify the passenger that one of the drivers denied.
+        # The request is still open to other drivers.
+        passenger = get_user_by_id(ride["passenger_id"])
+        if passenger:
+            send_to_username(passenger["username"], {"type": "DRIVER_RESPONSE", "payload": {"ride_id": ride_id, "status": "DENIED"}})
+        send_json(conn, {"type": "DRIVER_RESPONSE_OK", "payload": {"status": "DENIED"}})
 
 
 def handle_fetch_rides(conn, p):
     user_id = p["user_id"]
-    with db_lock:
-        rides = get_user_rides(user_id)
+    rides = get_user_rides(user_id)
     send_json(conn, {"type": "RIDES_LIST", "payload": {"rides": rides}})
 
 
@@ -289,55 +385,63 @@ def handle_update_rating(conn, p):
     ride_id = p["ride_id"]
     rater_id = p["rater_user_id"]
     rating = p["rating"]
-    with db_lock:
-        ride = get_ride_by_id(ride_id)
-        if not ride:
-            send_json(conn, {"type": "UPDATE_RATING_FAIL", "payload": {"reason": "Ride not found"}})
-            return
-        if rater_id not in (ride["passenger_id"], ride["driver_id"]):
-            send_json(conn, {"type": "UPDATE_RATING_FAIL", "payload": {"reason": "Not part of this ride"}})
-            return
-        if not can_edit_rating(ride):
-            send_json(conn, {"type": "UPDATE_RATING_FAIL", "payload": {"reason": "Rating window closed"}})
-            return
-        if rater_id == ride["passenger_id"]:
-            rated_user_id = ride["driver_id"]
-            role = "driver"
-        else:
-            rated_user_id = ride["passenger_id"]
-            role = "passenger"
-        upsert_rating(rated_user_id, rater_id, rating, role, ride_id)
-    send_json(conn, {"type": "UPDATE_RATING_OK"})
+    ride = get_ride_by_id(ride_id)
+    if not ride:
+        send_json(conn, {"type": "UPDATE_RATING_FAIL", "payload": {"reason": "Ride not found"}})
+        return
+    if rater_id not in (ride["passenger_id"], ride["driver_id"]):
+        send_json(conn, {"type": "UPDATE_RATING_FAIL", "payload": {"reason": "Not part of this ride"}})
+        return
+    if not can_edit_rating(ride):
+        send_json(conn, {"type": "UPDATE_RATING_FAIL", "payload": {"reason": "Rating window closed"}})
+        return
+    if rater_id == ride["passenger_id"]:
+        rated_user_id = ride["driver_id"]
+        role = "driver"
+    else:
+        rated_user_id = ride["passenger_id"]
+        role = "passenger"
+    upsert_rating(rated_user_id, rater_id, rating, role, ride_id)
+    send_static(conn, "UPDATE_RATING_OK")
+
+
+def _transition_fail_reason(ride):
+    """Why a ride state UPDATE matched no row, for the *_FAIL reply."""
+    if not ride:
+        return "ride not found"
+    return f"ride already {ride.get('status', '').lower()}"
 
 
 def handle_start_ride(conn, p):
     ride_id = p["ride_id"]
-    with db_lock:
-        start_ride(ride_id)
-        ride = get_ride_by_id(ride_id)
-        if ride:
-            passenger = get_user_by_id(ride.get("passenger_id"))
-            driver = get_user_by_id(ride.get("driver_id"))
-            if passenger:
-                send_to_username(passenger["username"], {"type": "RIDE_STARTED", "payload": {"ride_id": ride_id}})
-            if driver:
-                send_to_username(driver["username"], {"type": "RIDE_STARTED", "payload": {"ride_id": ride_id}})
-    send_json(conn, {"type": "START_RIDE_OK"})
+    started = start_ride(ride_id)
+    ride = get_ride_with_parties(ride_id)
+    # Repeated or disallowed transitions change no row
+    if not started:
+        send_json(conn, {"type": "START_RIDE_FAIL", "payload": {"reason": _transition_fail_reason(ride)}})
+        return
+    if ride:
+        notice = {"type": "RIDE_STARTED", "payload": {"ride_id": ride_id}}
+        for username in (ride["passenger_username"], ride["driver_username"]):
+            if username:
+                send_to_username(username, notice)
+    send_static(conn, "START_RIDE_OK")
 
 
 def handle_complete_ride(conn, p):
     ride_id = p["ride_id"]
-    with db_lock:
-        complete_ride(ride_id)
-        ride = get_ride_by_id(ride_id)
-        if ride:
-            passenger = get_user_by_id(ride.get("passenger_id"))
-            driver = get_user_by_id(ride.get("driver_id"))
-            if passenger:
-                send_to_username(passenger["username"], {"type": "RIDE_COMPLETED", "payload": {"ride_id": ride_id}})
-            if driver:
-                send_to_username(driver["username"], {"type": "RIDE_COMPLETED", "payload": {"ride_id": ride_id}})
-    send_json(conn, {"type": "COMPLETE_RIDE_OK"})
+    completed = complete_ride(ride_id)
+    ride = get_ride_with_parties(ride_id)
+    # Repeated or disallowed transitions change no row
+    if not completed:
+        send_json(conn, {"type": "COMPLETE_RIDE_FAIL", "payload": {"reason": _transition_fail_reason(ride)}})
+        return
+    if ride:
+        notice = {"type": "RIDE_COMPLETED", "payload": {"ride_id": ride_id}}
+        for username in (ride["passenger_username"], ride["driver_username"]):
+            if username:
+                send_to_username(username, notice)
+    send_static(conn, "COMPLETE_RIDE_OK")
 
 
 def handle_cancel_ride(conn, p):
@@ -349,42 +453,38 @@ def handle_cancel_ride(conn, p):
     if ride_id is None:
         send_json(conn, {"type": "CANCEL_RIDE_FAIL", "payload": {"reason": "ride_id missing"}})
         return
-    with db_lock:
-        ride = get_ride_by_id(ride_id)
-        if not ride:
-            send_json(conn, {"type": "CANCEL_RIDE_FAIL", "payload": {"reason": "ride not found"}})
-            return
-        # Only allow cancelling if ride hasn't completed
-        if ride.get("status") == "COMPLETED":
-            send_json(conn, {"type": "CANCEL_RIDE_FAIL", "payload": {"reason": "ride already completed"}})
-            return
-        update_ride_status(ride_id, "CANCELLED")
-        # notify counterpart if connected
-        passenger = get_user_by_id(ride.get("passenger_id"))
-        driver = get_user_by_id(ride.get("driver_id"))
-        if passenger and driver:
-            # notify both
-            send_to_username(passenger["username"], {"type": "RIDE_CANCELLED", "payload": {"ride_id": ride_id}})
-            send_to_username(driver["username"], {"type": "RIDE_CANCELLED", "payload": {"ride_id": ride_id}})
-        elif passenger:
-            send_to_username(passenger["username"], {"type": "RIDE_CANCELLED", "payload": {"ride_id": ride_id}})
-        elif driver:
-            send_to_username(driver["username"], {"type": "RIDE_CANCELLED", "payload": {"ride_id": ride_id}})
-    send_json(conn, {"type": "CANCEL_RIDE_OK"})
+    ride = get_ride_with_parties(ride_id)
+    if not ride:
+        send_json(conn, {"type": "CANCEL_RIDE_FAIL", "payload": {"reason": "ride not found"}})
+        return
+    # Completed or already cancelled rides can't be cancelled
+    if not update_ride_status(ride_id, "CANCELLED"):
+        send_json(conn, {"type": "CANCEL_RIDE_FAIL", "payload": {"reason": f"ride already {ride.get('status', '').lower()}"}})
+        return
+    # notify both parties if connected
+    notice = {"type": "RIDE_CANCELLED", "payload": {"ride_id": ride_id}}
+    for username in (ride["passenger_username"], ride["driver_username"]):
+        if username:
+            send_to_username(username, notice)
+    send_static(conn, "CANCEL_RIDE_OK")
 
 
 def handle_list_contacts(conn, p):
     user_id = p["user_id"]
-    with db_lock:
-        contacts = list_contacts(user_id)
+    contacts = list_contacts(user_id)
     send_json(conn, {"type": "CONTACTS", "payload": {"contacts": contacts}})
 
 
 def handle_fetch_messages(conn, p):
     user_id = p["user_id"]
     partner_id = p["partner_id"]
-    with db_lock:
-        messages = fetch_messages(user_id, partner_id)
+    messages = fetch_messages(user_id, partner_id)
+    for m in messages:
+        # Attachments are stored as bytes but travel inline as base64 text
+        m["attachment_data"] = None
+        if m["attachment_size"] is not None:
+            with open_attachment(m["id"]) as blob:
+                m["attachment_data"] = base64.b64encode(blob.read()).decode("ascii")
     send_json(conn, {"type": "MESSAGES", "payload": {"messages": messages}})
 
 
@@ -393,23 +493,30 @@ def handle_send_message(conn, p, sender_username):
     message = p["message"]
     attachment_filename = p.get("attachment_filename")
     attachment_mime = p.get("attachment_mime")
+    # Raw bytes sent out of band, or base64 inline from older clients
+    attachment_bytes = p.get("attachment_bytes")
     attachment_data = p.get("attachment_data")
     if not sender_username:
         send_json(conn, {"type": "SEND_MESSAGE_FAIL", "payload": {"reason": "Not authenticated"}})
         return
-    with db_lock:
-        sender = get_user_by_username(sender_username)
-        receiver = get_user_by_username(to_username)
-        if not sender or not receiver:
-            send_json(conn, {"type": "SEND_MESSAGE_FAIL", "payload": {"reason": "User not found"}})
+    sender = get_user_by_username(sender_username)
+    receiver = get_user_by_username(to_username)
+    if not sender or not receiver:
+        send_json(conn, {"type": "SEND_MESSAGE_FAIL", "payload": {"reason": "User not found"}})
+        return
+    if attachment_bytes is None and attachment_data:
+        try:
+            attachment_bytes = base64.b64decode(attachment_data, validate=True)
+        except (binascii.Error, ValueError):
+            send_json(conn, {"type": "SEND_MESSAGE_FAIL", "payload": {"reason": "Invalid attachment"}})
             return
-        if attachment_data:
-            msg = save_message_with_attachment(sender["id"], receiver["id"], message,
-                                               attachment_filename=attachment_filename,
-                                               attachment_mime=attachment_mime,
-                                               attachment_data=attachment_data)
-        else:
-            msg = save_message(sender["id"], receiver["id"], message)
+    if attachment_bytes is not None:
+        msg = save_message_with_attachment(sender["id"], receiver["id"], message,
+                                           attachment_filename=attachment_filename,
+                                           attachment_mime=attachment_mime,
+                                           attachment_data=attachment_bytes)
+    else:
+        msg = save_message(sender["id"], receiver["id"], message)
     send_json(conn, {"type": "SEND_MESSAGE_OK", "payload": msg})
     send_to_username(to_username, {"type": "CHAT_MESSAGE", "payload": {
         "from": sender_username,
@@ -419,67 +526,129 @@ def handle_send_message(conn, p, sender_username):
         "sent_at": msg["sent_at"],
         "attachment_filename": attachment_filename,
         "attachment_mime": attachment_mime,
-        "attachment_data": attachment_data
-    }})
+        "attachment_data": None
+    }}, attachment=attachment_bytes)
 
 
-def handle_client(conn, addr):
-    username = None
-    user_id = None
-    try:
+def _login(session, p):
+    session.username, session.user_id = handle_login(session.conn, p)
+    if session.username:
+        clients[session.username] = {"conn": session.conn, "addr": session.addr, "user_id": session.user_id}
+
+
+def _announce_peer(session, p):
+    handle_announce_peer(session.conn, p, session.username, session.addr)
+
+
+def _driver_response(session, p):
+    handle_driver_response(session.conn, p, session.user_id)
+
+
+def _send_message(session, p):
+    handle_send_message(session.conn, p, session.username)
+
+
+# message type -> (handler, whether it takes the ClientSession rather than the socket)
+HANDLERS = {
+    "REGISTER": (handle_register, False),
+    "LOGIN": (_login, True),
+    "SET_ROLE": (handle_set_role, False),
+    "ADD_SCHEDULE": (handle_add_schedule, False),
+    "LIST_SCHEDULE": (handle_list_schedule, False),
+    "DELETE_SCHEDULE": (handle_delete_schedule, False),
+    "BROADCAST_RIDE_REQUEST": (handle_broadcast_ride_request, False),
+    "FETCH_RIDE_REQUESTS": (handle_fetch_ride_requests, False),
+    "FETCH_PENDING": (handle_fetch_pending, False),
+    "DRIVER_RESPONSE": (_driver_response, True),
+    "ANNOUNCE_PEER": (_announce_peer, True),
+    "FETCH_RIDES": (handle_fetch_rides, False),
+    "CANCEL_RIDE": (handle_cancel_ride, False),
+    "UPDATE_RATING": (handle_update_rating, False),
+    "START_RIDE": (handle_start_ride, False),
+    "COMPLETE_RIDE": (handle_complete_ride, False),
+    "LIST_CONTACTS": (handle_list_contacts, False),
+    "FETCH_MESSAGES": (handle_fetch_messages, False),
+    "SEND_MESSAGE": (_send_message, True),
+}
+
+
+def dispatch(session, msg):
+    """Run the handler for one client message."""
+    entry = HANDLERS.get(msg.get("type"))
+    if entry is None:
+        send_json(session.conn, {"type": "ERROR", "payload": {"message": "Unknown type"}})
+        return
+    handler, takes_session = entry
+    handler(session if takes_session else session.conn, msg.get("payload", {}))
+
+
+class ClientSession:
+    """One client connection: its login state and the messages waiting to be handled.
+
+    The selector thread queues messages with `push`; at most one HANDLER_POOL task
+    drains a session at a time, so a client's messages are handled in order.
+    """
+
+    def __init__(self, conn, addr):
+        self.conn = conn
+        self.addr = addr
+        self.username = None
+        self.user_id = None
+        self.framer = JsonFramer()
+        self._inbox = deque()
+        self._lock = threading.Lock()
+        self._running = False
+        self._closing = False
+
+    def push(self, messages, closing=False):
+        with self._lock:
+            self._inbox.extend(messages)
+            self._closing = self._closing or closing
+            if self._running:
+                return
+            self._running = True
+        HANDLER_POOL.submit(self._drain)
+
+    def _drain(self):
         while True:
-            msg = recv_json(conn)
-            if not msg:
-                break
-            t = msg.get("type")
-            p = msg.get("payload", {})
-
-            if t == "REGISTER":
-                handle_register(conn, p)
-            elif t == "LOGIN":
-                username, user_id = handle_login(conn, p)
-                if username:
-                    clients[username] = {"conn": conn, "addr": addr, "user_id": user_id}
-            elif t == "SET_ROLE":
-                handle_set_role(conn, p)
-            elif t == "ADD_SCHEDULE":
-                handle_add_schedule(conn, p)
-            elif t == "LIST_SCHEDULE":
-                handle_list_schedule(conn, p)
-            elif t == "DELETE_SCHEDULE":
-                handle_delete_schedule(conn, p)
-            elif t == "BROADCAST_RIDE_REQUEST":
-                handle_broadcast_ride_request(conn, p)
-            elif t == "FETCH_RIDE_REQUESTS":
-                handle_fetch_ride_requests(conn, p)
-            elif t == "FETCH_PENDING":
-                handle_fetch_pending(conn, p)
-            elif t == "DRIVER_RESPONSE":
-                handle_driver_response(conn, p)
-            elif t == "ANNOUNCE_PEER":
-                handle_announce_peer(conn, p, username, addr)
-            elif t == "FETCH_RIDES":
-                handle_fetch_rides(conn, p)
-            elif t == "CANCEL_RIDE":
-                handle_cancel_ride(conn, p)
-            elif t == "UPDATE_RATING":
-                handle_update_rating(conn, p)
-            elif t == "START_RIDE":
-                handle_start_ride(conn, p)
-            elif t == "COMPLETE_RIDE":
-                handle_complete_ride(conn, p)
-            elif t == "LIST_CONTACTS":
-                handle_list_contacts(conn, p)
-            elif t == "FETCH_MESSAGES":
-                handle_fetch_messages(conn, p)
-            elif t == "SEND_MESSAGE":
-                handle_send_message(conn, p, username)
-            else:
-                send_json(conn, {"type": "ERROR", "payload": {"message": "Unknown type"}})
-    finally:
-        if username in clients:
-            del clients[username]
-        conn.close()
+            with self._lock:
+                if not self._inbox:
+                    self._running = False
+                    closing = self._closing
+                    break
+                msg = self._inbox.popleft()
+            try:
+                dispatch(self, msg)
+            except Exception:
+                traceback.print_exc()
+                # Drop the client as before; the selector thread sees EOF and queues the close
+                try:
+                    self.conn.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+        if closing:
+            self.close()
+
+    def close(self):
+        if self.username in clients:
+            del clients[self.username]
+        send_locks.pop(self.conn, None)
+        self.conn.close()
+
+
+def _on_readable(selector, session):
+    """Read what one client sent and queue the complete messages for its session."""
+    try:
+        data = session.conn.recv(READ_BUFFER_SIZE)
+    except OSError:
+        data = b""
+    messages = session.framer.feed(data) if data else [None]
+    if None in messages:
+        # Connection closed or sent something unreadable: handle what came before, then close
+        selector.unregister(session.conn)
+        session.push(messages[:messages.index(None)], closing=True)
+    elif messages:
+        session.push(messages)
 
 
 # -----------------------------
@@ -490,11 +659,26 @@ def start_server():
     s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
     s.bind((HOST, PORT))
-    s.listen(10)
+    s.listen(128)
+    s.setblocking(False)
+    selector = selectors.DefaultSelector()
+    selector.register(s, selectors.EVENT_READ)
     print(f"[+] Server running on {HOST}:{PORT}")
     while True:
-        conn, addr = s.accept()
-        threading.Thread(target=handle_client, args=(conn, addr), daemon=True).start()
+        for key, _ in selector.select():
+            if key.fileobj is not s:
+                _on_readable(selector, key.data)
+                continue
+            try:
+                conn, addr = s.accept()
+            except BlockingIOError:
+                continue
+            # Reads only happen once select() reports data; handlers write with plain blocking sends
+            conn.setblocking(True)
+            # Every message goes out in one send, so there is nothing for Nagle's algorithm to coalesce
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            send_locks[conn] = threading.Lock()
+            selector.register(conn, selectors.EVENT_READ, ClientSession(conn, addr))
 
 
 if __name__ == "__main__":